@@ -6,6 +6,7 @@ from sqlite3 import Connection
 from colorama import Style  # type: ignore
 from libbear import database as db
 from libbear import sync
+from libbear.daemon import SyncDaemon
 
 
 if __name__ == "__main__":
@@ -18,12 +19,46 @@ if __name__ == "__main__":
         action="store_true",
         help="Find notes with duplicate titles",
     )
+    parser.add_argument(
+        "--near",
+        dest="near",
+        action="store_true",
+        help="With --duplicates, find notes with similar text instead",
+    )
+    parser.add_argument(
+        "--threshold",
+        dest="threshold",
+        type=float,
+        default=0.8,
+        help="Similarity (0-1) of near-duplicate notes (default: 0.8)",
+    )
     parser.add_argument(
         "--sync", dest="sync", action="store_true", help="Sync notes with Mardown files"
     )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        action="store_true",
+        help="Keep syncing notes with Markdown files as they change",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="FILE",
+        help="With --sync or --watch, save a cProfile of the slowest sync stage",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="With --sync, only list the exported files that would change",
+    )
     parser.add_argument(
         "--tasks", dest="tasks", action="store_true", help="List all tasks"
     )
+    parser.add_argument(
+        "--search", dest="search", metavar="QUERY", help="Full-text search of notes"
+    )
     parser.add_argument(
         "--links", dest="links", action="store_true", help="Show callback links"
     )
@@ -32,11 +67,21 @@ if __name__ == "__main__":
 
     conn: Connection = db.get_connection()
 
-    if args.duplicates:
+    if args.duplicates and args.near:
+        db.get_near_duplicates(conn, args.threshold)
+    elif args.duplicates:
         db.get_duplicate_titles(conn)
     elif args.sync:
         bear_sync = sync.BearSync()
+        bear_sync.profile_file = args.profile
+        bear_sync.dry_run = args.dry_run
         bear_sync.sync()
+        for action, path in bear_sync.dry_run_changes:
+            print(f"{action}: {path}")
+    elif args.watch:
+        bear_sync = sync.BearSync()
+        bear_sync.profile_file = args.profile
+        SyncDaemon(bear_sync).run()
     elif args.tasks:
         tasks = db.get_all_tasks(conn)
         for key in tasks:
@@ -48,6 +93,15 @@ if __name__ == "__main__":
                 )
             for task in tasks[key]:
                 print(Style.NORMAL + f"\t{task.task}")
+    elif args.search:
+        for result in db.search(conn, args.search):
+            print(Style.DIM + result.title)
+            if args.links:
+                print(
+                    Style.DIM
+                    + f"bear://x-callback-url/open-note?id={result.identifier}"
+                )
+            print(Style.NORMAL + f"\t{result.snippet}")
     else:
         parser.print_help()
 
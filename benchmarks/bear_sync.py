@@ -0,0 +1,257 @@
+"""Benchmark BearSync stages against a synthetic Bear database
+
+Run with `python -m benchmarks.bear_sync [--notes N] [--runs R] [--json FILE]`.
+Pass `--compare FILE` with the results of an earlier run to spot regressions.
+"""
+# pylint: disable=R0913,R0914
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import urllib.parse
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.bear_tokens import WORDS, synthetic_note
+from libbear.sync import BearSync, note_title
+
+# Seconds since 2001-01-01, as stored by Bear
+BEAR_NOW = time.time() - 978307200
+
+
+def make_database(
+    path: str,
+    image_path: str,
+    notes: int,
+    *,
+    tag_depth: int = 2,
+    images: float = 0.2,
+    lines: int = 30,
+    seed: int = 42,
+) -> None:
+    """Bear database of `notes` notes of about `lines` lines, tagged `tag_depth`
+    levels deep, a fraction `images` of them referencing an image"""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE ZSFNOTE (Z_PK INTEGER PRIMARY KEY, ZTITLE TEXT, ZTEXT TEXT, "
+        "ZMODIFICATIONDATE REAL, ZCREATIONDATE REAL, ZUNIQUEIDENTIFIER TEXT, "
+        "ZTRASHED INTEGER, ZARCHIVED INTEGER)"
+    )
+    rows = []
+    for index in range(notes):
+        title = f"Note {index} {rnd.choice(WORDS)}"
+        tag = "/".join(rnd.choices(WORDS, k=tag_depth))
+        text = synthetic_note(rnd, lines).split("\n", 1)[1]
+        # No random image links, so every referenced image exists
+        text = "\n".join(line for line in text.split("\n") if "[image:" not in line)
+        if rnd.random() < images:
+            image = f"{index:06X}/image.png"
+            os.makedirs(os.path.join(image_path, f"{index:06X}"), exist_ok=True)
+            with open(os.path.join(image_path, image), "wb") as data:
+                data.write(os.urandom(4096))
+            text += f"\n[image:{image}]"
+        created = BEAR_NOW - rnd.uniform(86400, 86400 * 365)
+        rows.append(
+            (
+                title,
+                f"# {title}\n{text}\n#{tag}\n",
+                created + rnd.uniform(0, 86400),
+                created,
+                f"UUID-{index:08d}",
+            )
+        )
+    conn.executemany(
+        "INSERT INTO ZSFNOTE (ZTITLE, ZTEXT, ZMODIFICATIONDATE, ZCREATIONDATE, "
+        "ZUNIQUEIDENTIFIER, ZTRASHED, ZARCHIVED) VALUES (?, ?, ?, ?, ?, 0, 0)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def apply_update(db_path: str, args: List[str]) -> int:
+    """Apply an x-callback update to the database, as Bear would"""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(args[-1]).query)
+    conn = sqlite3.connect(db_path)
+    if "id" in query:
+        conn.execute(
+            "UPDATE ZSFNOTE SET ZMODIFICATIONDATE = ? WHERE ZUNIQUEIDENTIFIER = ?",
+            (time.time() - 978307200, query["id"][0]),
+        )
+    else:
+        text = query.get("text", [""])[0]
+        conn.execute(
+            "INSERT INTO ZSFNOTE (ZTITLE, ZTEXT, ZMODIFICATIONDATE, "
+            "ZUNIQUEIDENTIFIER, ZTRASHED, ZARCHIVED) VALUES (?, ?, ?, ?, 0, 0)",
+            (
+                note_title(text),
+                text,
+                time.time() - 978307200,
+                f"NEW-{time.time()}",
+            ),
+        )
+    conn.commit()
+    conn.close()
+    return 0
+
+
+def fake_bear(db_path: str) -> Callable[[List[str]], int]:
+    """Launcher standing in for Bear, applying x-callback updates instantly.
+    Module-level, so it pickles like the default launcher."""
+    return functools.partial(apply_update, db_path)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process and its finished children"""
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * unit / 1e6
+
+
+def run_once(root: str, args: argparse.Namespace) -> Dict[str, Tuple[float, int]]:
+    """Time each stage once, returning seconds and items handled per stage"""
+    library = os.path.join(root, "Bear")
+    image_path = os.path.join(library, "Note Images")
+    os.makedirs(image_path)
+    db_path = os.path.join(library, "database.sqlite")
+    make_database(
+        db_path,
+        image_path,
+        args.notes,
+        tag_depth=args.tag_depth,
+        images=args.images,
+        lines=args.lines,
+    )
+    bear_sync = BearSync(
+        home=root,
+        export_path=os.path.join(root, "BearNotes"),
+        bear_db=db_path,
+        bear_image_path=image_path,
+    )
+    bear_sync.render_workers = args.workers
+    bear_sync.sync_debounce = 0.0
+    bear_sync.launcher = fake_bear(db_path)
+    results = {}
+
+    texts = [row[0] for row in bear_sync.connect().execute("SELECT ZTEXT FROM ZSFNOTE")]
+    start = time.perf_counter()
+    for text in texts:
+        bear_sync.sub_path_from_tag(bear_sync.temp_path, "note.md", text)
+    results["tag extraction"] = (time.perf_counter() - start, len(texts))
+
+    manifest = bear_sync.load_manifest()
+    start = time.perf_counter()
+    exported = bear_sync.export_markdown(manifest)
+    results["export_markdown"] = (time.perf_counter() - start, exported)
+
+    images = len(manifest.referenced_images())
+    start = time.perf_counter()
+    bear_sync.copy_bear_images(manifest)
+    results["images"] = (time.perf_counter() - start, images)
+
+    # Publish the export (rsync in a real sync), then edit some of the notes
+    bear_sync.write_time_stamp()
+    shutil.copytree(bear_sync.temp_path, bear_sync.export_path, dirs_exist_ok=True)
+    bear_sync.update_sync_time_file(0)
+    edited = []
+    for folder, _, files in os.walk(bear_sync.export_path):
+        edited += [os.path.join(folder, name) for name in files if name.endswith(".md")]
+    edited = sorted(edited)[: args.updates]
+    later = time.time() + 1
+    for path in edited:
+        with open(path, "a", encoding="utf-8") as note:
+            note.write("\nEdited outside Bear\n")
+        os.utime(path, (later, later))
+    start = time.perf_counter()
+    # Imports print the notes they send to Bear
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            bear_sync.sync_md_updates()
+    results["sync_md_updates"] = (time.perf_counter() - start, len(edited))
+    if bear_sync.journal is not None:
+        bear_sync.journal.close()
+    bear_sync.connection.close()
+    return results
+
+
+def report(runs: List[Dict[str, Tuple[float, int]]]) -> Dict[str, Dict[str, float]]:
+    """Median time and throughput per stage"""
+    summary = {}
+    for stage in runs[0]:
+        times = [run[stage][0] for run in runs]
+        items = runs[0][stage][1]
+        median = statistics.median(times)
+        summary[stage] = {
+            "median": median,
+            "min": min(times),
+            "items": items,
+            "per_second": items / median if median > 0 else 0.0,
+        }
+    return summary
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="BearSync benchmark")
+    parser.add_argument("--notes", type=int, default=2000, help="Notes in the database")
+    parser.add_argument("--lines", type=int, default=30, help="Lines per note")
+    parser.add_argument("--tag-depth", type=int, default=2, help="Levels of tags")
+    parser.add_argument(
+        "--images", type=float, default=0.2, help="Fraction of notes with an image"
+    )
+    parser.add_argument("--updates", type=int, default=50, help="Notes edited")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Render processes"
+    )
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    args = parser.parse_args()
+    logging.getLogger("bear").setLevel(logging.WARNING)
+
+    runs = []
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="bear-bench-") as root:
+            runs.append(run_once(root, args))
+        print(f"run {run + 1}/{args.runs}: peak RSS {peak_rss_mb():.0f} MB")
+    summary = report(runs)
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as results:
+            earlier = json.load(results)
+        previous = earlier["stages"]
+        settings = ("notes", "lines", "tag_depth", "images", "updates", "workers")
+        if any(earlier["args"].get(key) != getattr(args, key) for key in settings):
+            print("Note: the earlier run used different settings")
+    for stage, result in summary.items():
+        line = (
+            f"{stage:>16}: {result['median']:.3f}s median, {result['min']:.3f}s min "
+            f"({result['per_second']:.0f}/s)"
+        )
+        if stage in previous and previous[stage]["median"] > 0:
+            line += f", {result['median'] / previous[stage]['median']:.2f}x previous"
+        print(line)
+    print(f"{'peak RSS':>16}: {peak_rss_mb():.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as results:
+            json.dump(
+                {"args": vars(args), "stages": summary, "peak_rss_mb": peak_rss_mb()},
+                results,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
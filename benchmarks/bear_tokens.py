@@ -0,0 +1,83 @@
+"""Benchmark the single-pass Bear token extraction against the per-pattern regexes
+
+Run with `python -m benchmarks.bear_tokens [--notes N]`
+"""
+import argparse
+import random
+import re
+import time
+from typing import Callable, List, Tuple
+
+from libbear import tokens
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "bear", "note", "sync", "tag"]
+
+
+def synthetic_note(rnd: random.Random, lines: int = 30) -> str:
+    """A note with a mix of text, tags, tasks and image links"""
+    body = ["# " + " ".join(rnd.choices(WORDS, k=4))]
+    for _ in range(lines):
+        roll = rnd.random()
+        text = " ".join(rnd.choices(WORDS, k=rnd.randint(3, 12)))
+        if roll < 0.1:
+            body.append(f"- [ ] {text}")
+        elif roll < 0.15:
+            body.append(f"- [x] {text}")
+        elif roll < 0.2:
+            body.append(f"[image:{rnd.randint(0, 9999):04X}/{rnd.choice(WORDS)}.png]")
+        elif roll < 0.25:
+            body.append(f"{text} #{rnd.choice(WORDS)}/{rnd.choice(WORDS)} {text}")
+        elif roll < 0.28:
+            body.append(f"#{rnd.choice(WORDS)} {rnd.choice(WORDS)}# {text}")
+        else:
+            body.append(text)
+    body.append(f"#{rnd.choice(WORDS)}/{rnd.choice(WORDS)}")
+    return "\n".join(body)
+
+
+def legacy_tokenize(text: str) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Token extraction as previously done by `sync.py` and `database.py`"""
+    pattern1 = r"(?<!\S)\#([.\w\/\-]+)[ \n]?(?!([\/ \w]+\w[#]))"
+    pattern2 = r"(?<![\S])\#([^ \d][.\w\/ ]+?)\#([ \n]|$)"
+    hash_tags = [match[0] for match in re.findall(pattern1, text)]
+    closed_tags = [match[0] for match in re.findall(pattern2, text)]
+    tasks = re.findall(r"- \[ \] (.*)", text)
+    images = re.findall(r"\[image:(.+?)\]", text)
+    return hash_tags, closed_tags, tasks, images
+
+
+def single_pass(text: str) -> Tuple[List[str], List[str], List[str], List[str]]:
+    """Token extraction with `libbear.tokens`"""
+    note_tokens = tokens.tokenize(text)
+    return (
+        note_tokens.hash_tags,
+        note_tokens.closed_tags,
+        note_tokens.tasks,
+        note_tokens.images,
+    )
+
+
+def timed(method: Callable, corpus: List[str]) -> Tuple[float, list]:
+    """Run `method` over the corpus"""
+    start = time.perf_counter()
+    results = [method(text) for text in corpus]
+    return time.perf_counter() - start, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bear token extraction benchmark")
+    parser.add_argument("--notes", type=int, default=50000, help="Notes in the corpus")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    generator = random.Random(args.seed)
+    notes = [synthetic_note(generator) for _ in range(args.notes)]
+    size = sum(len(note) for note in notes) / 1e6
+    print(f"{args.notes} notes, {size:.1f} MB")
+
+    legacy_time, expected = timed(legacy_tokenize, notes)
+    new_time, actual = timed(single_pass, notes)
+    assert expected == actual, "token extraction differs from the legacy regexes"
+    for name, elapsed in (("legacy regexes", legacy_time), ("single pass", new_time)):
+        print(f"{name:>15}: {elapsed:.2f}s ({args.notes / elapsed:.0f} notes/s)")
+    print(f"{'speedup':>15}: {legacy_time / new_time:.2f}x")
@@ -0,0 +1,138 @@
+"""Benchmark the html.parser and lxml parsers and the prettify and compact
+serializers on Jupyter Book pages (jboptim) and a TiddlyWiki file (libsardine),
+checking that every backend gives equivalent documents
+
+Run with `python -m benchmarks.html_backends [--source DIR] [--wiki FILE]`
+"""
+import argparse
+import contextlib
+import html
+import os
+import random
+import time
+from typing import Dict, List, Tuple
+
+import jboptim
+import libsardine
+from benchmarks.jboptim_rules import WORDS, synthetic_page
+from common.html_backend import PARSERS, SERIALIZERS, Backend, differences
+
+REFERENCE = Backend()
+BACKENDS = [
+    Backend(parser, serializer) for parser in PARSERS for serializer in SERIALIZERS
+]
+
+
+def synthetic_wiki(rnd: random.Random, tiddlers: int) -> str:
+    """A TiddlyWiki file with `tiddlers` tiddlers, and some system ones"""
+    store = []
+    for index in range(tiddlers):
+        title = f"$:/config/{index}" if index % 10 == 0 else f"Tiddler {index}"
+        text = "\n".join(
+            html.escape(f"* {' '.join(rnd.choices(WORDS, k=12))} <<macro>> & more")
+            for _ in range(rnd.randint(5, 40))
+        )
+        store.append(
+            f'<div created="20201010{index:06d}" modified="20201011{index:06d}" '
+            f'tags="{rnd.choice(WORDS)} [[{rnd.choice(WORDS)} notes]]" '
+            f'title="{html.escape(title)}" type="text/vnd.tiddlywiki">\n'
+            f"<pre>{text}</pre>\n</div>"
+        )
+    return (
+        '<!doctype html>\n<html>\n<head>\n<meta charset="utf-8">\n'
+        "<title>Wiki</title>\n</head>\n<body>\n"
+        '<div id="storeArea" style="display:none;">\n'
+        + "\n".join(store)
+        + "\n</div>\n</body>\n</html>\n"
+    )
+
+
+def book(pages: List[str]) -> Dict[str, Tuple[float, float, float, int, int]]:
+    """Parse, rules and serialize times, output size and pages differing from
+    the reference backend, per backend"""
+    rules = jboptim.RuleSet(jboptim.DEFAULT_RULES)
+    results = {}
+    reference: List[str] = []
+    for backend in [REFERENCE] + [other for other in BACKENDS if other != REFERENCE]:
+        start = time.perf_counter()
+        docs = [jboptim.parse_html(page, backend) for page in pages]
+        parsed = time.perf_counter()
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                for doc in docs:
+                    jboptim.optimise(doc, rules)
+        optimised = time.perf_counter()
+        outputs = [backend.serialize(doc) for doc in docs]
+        serialized = time.perf_counter()
+        if not reference:
+            reference = outputs
+        differing = sum(
+            1 for one, other in zip(reference, outputs) if differences(one, other)
+        )
+        results[backend.name] = (
+            parsed - start,
+            optimised - parsed,
+            serialized - optimised,
+            sum(len(output) for output in outputs),
+            differing,
+        )
+    return results
+
+
+def wiki(source: str) -> Dict[str, Tuple[float, float, int, bool]]:
+    """Time to parse the wiki and extract its tiddlers, time to serialize it,
+    its size and whether it matches the reference backend, per backend"""
+    results = {}
+    reference = None
+    for backend in [REFERENCE] + [other for other in BACKENDS if other != REFERENCE]:
+        start = time.perf_counter()
+        soup = libsardine.parse_html(source, backend)
+        tiddlers = libsardine.get_tiddlers(soup)
+        parsed = time.perf_counter()
+        output = backend.serialize(soup, formatter=None)
+        serialized = time.perf_counter()
+        if reference is None:
+            reference = (tiddlers, output)
+        same = tiddlers == reference[0] and not differences(reference[1], output)
+        results[backend.name] = (parsed - start, serialized - parsed, len(output), same)
+    return results
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="HTML backends benchmark")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic pages")
+    parser.add_argument("--source", help="Use the HTML files of a built book instead")
+    parser.add_argument("--tiddlers", type=int, default=5000, help="Synthetic tiddlers")
+    parser.add_argument("--wiki", help="Use this TiddlyWiki file instead")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+    generator = random.Random(args.seed)
+
+    if args.source:
+        paths = jboptim.get_html_files(args.source)
+        pages = [jboptim.read_file(path) for path in paths]
+    else:
+        pages = [synthetic_page(generator, index) for index in range(args.pages)]
+    print(f"Jupyter Book: {len(pages)} pages, {sum(map(len, pages)) / 1e6:.1f} MB")
+    for name, (parse, rules, serialize, size, differing) in book(pages).items():
+        print(
+            f"{name:>22}: parse {parse:.2f}s, rules {rules:.2f}s, "
+            f"serialize {serialize:.2f}s, {size / 1e6:.1f} MB, "
+            f"{differing} pages not equivalent"
+        )
+
+    if args.wiki:
+        source = libsardine.read_file(args.wiki)
+    else:
+        source = synthetic_wiki(generator, args.tiddlers)
+    print(f"TiddlyWiki: {len(source) / 1e6:.1f} MB")
+    for name, (parse, serialize, size, same) in wiki(source).items():
+        print(
+            f"{name:>22}: parse and extract {parse:.2f}s, serialize {serialize:.2f}s, "
+            f"{size / 1e6:.1f} MB, {'equivalent' if same else 'NOT equivalent'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
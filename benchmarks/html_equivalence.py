@@ -0,0 +1,166 @@
+"""Check that every parser and serializer of `common.html_backend` gives documents
+equivalent to `html.parser` + `prettify`, after the jboptim rules on Jupyter Book
+pages and when reading tiddlers with libsardine
+
+Run with `python -m benchmarks.html_equivalence [--source DIR] [--wiki FILE]`,
+exits with an error listing the differences if a backend is not equivalent
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+from typing import List
+
+from bs4 import BeautifulSoup  # type: ignore
+
+import jboptim
+import libsardine
+from benchmarks.html_backends import BACKENDS, REFERENCE, synthetic_wiki
+from benchmarks.jboptim_rules import synthetic_page
+from common.html_backend import Backend, differences
+
+# Constructs where parsers or serializers are most likely to disagree
+EDGE_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Edge &amp; cases</title>
+<link rel="next" title="Next" href="next.html" />
+<script>if (a < b && c > d) { document.write("<p>x</p>"); }</script>
+<style>p > a { color: red; }</style>
+</head>
+<body>
+<!-- a comment -->
+<div id="main-content" class="row  wide">
+<p>Entities &lt;tag&gt; &amp;&nbsp;&copy; and &#x2014; <b>bold</b><i>italic</i></p>
+<p>Void<br>elements<img src="a.png" alt="A &quot;quoted&quot; image"><hr></p>
+<div class="cell tag_hide-input docutils container">
+<div class="cell_input docutils container">
+<div class="highlight"><pre>  indented
+    code &lt;here&gt;
+
+trailing  </pre></div>
+<a class="copybtn" data-tooltip="Copy">copy</a></div>
+<div class="cell_output docutils container">
+<pre>Traceback:
+  File "C:\\path\\file.py", line 1</pre>
+<table border="1"><tr><td>1</td><td></td></tr></table>
+<textarea>  kept
+ as is</textarea>
+</div>
+</div>
+<ul><li>one</li><li>two <a href="x.html?a=1&amp;b=2">link</a></li></ul>
+</div>
+</body>
+</html>
+"""
+
+EDGE_TIDDLERS = """<div created="20201010" title="Quotes &quot;and&quot; &amp;" \
+tags="[[two words]] tag" type="text/vnd.tiddlywiki">
+<pre>Line with &lt;&lt;macro&gt;&gt; &amp; entities
+
+  indented line
+</pre>
+</div>
+<div title="Empty"><pre></pre></div>
+"""
+
+
+def edge_wiki(rnd: random.Random) -> str:
+    """A small wiki with the synthetic tiddlers and some unusual ones"""
+    wiki = synthetic_wiki(rnd, 20)
+    return wiki.replace(
+        'style="display:none;">\n', 'style="display:none;">\n' + EDGE_TIDDLERS
+    )
+
+
+def preformatted(html: str) -> List[str]:
+    """Texts of the elements whose whitespace matters"""
+    doc = BeautifulSoup(html, features="html.parser")
+    return [element.get_text() for element in doc.find_all(["pre", "textarea"])]
+
+
+def check_book(pages: List[str]) -> List[str]:
+    """Differences from the reference backend of the pages after the jboptim rules"""
+    rules = jboptim.RuleSet(jboptim.DEFAULT_RULES)
+
+    def optimised(page: str, backend: Backend) -> str:
+        doc = jboptim.parse_html(page, backend)
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                jboptim.optimise(doc, rules)
+        return backend.serialize(doc)
+
+    found = []
+    for index, page in enumerate(pages):
+        reference = optimised(page, REFERENCE)
+        for backend in BACKENDS:
+            output = optimised(page, backend)
+            found += [
+                f"page {index}, {backend.name}: {difference}"
+                for difference in differences(reference, output)
+            ]
+            if preformatted(output) != preformatted(reference):
+                found.append(f"page {index}, {backend.name}: different <pre> texts")
+    return found
+
+
+def check_wiki(source: str) -> List[str]:
+    """Differences from the reference backend of the tiddlers of a wiki, of the
+    wiki as libsardine writes it back and of the tiddlers read from that"""
+
+    def read(html: str, backend: Backend) -> List[libsardine.Tiddler]:
+        return libsardine.get_tiddlers(libsardine.parse_html(html, backend))
+
+    soup = libsardine.parse_html(source, REFERENCE)
+    tiddlers = libsardine.get_tiddlers(soup)
+    reference = REFERENCE.serialize(soup, formatter=None)
+    written = read(reference, REFERENCE)
+    found = []
+    for backend in BACKENDS:
+        soup = libsardine.parse_html(source, backend)
+        if libsardine.get_tiddlers(soup) != tiddlers:
+            found.append(f"{backend.name}: different tiddlers")
+        output = backend.serialize(soup, formatter=None)
+        found += [
+            f"{backend.name}: {difference}"
+            for difference in differences(reference, output)
+        ]
+        if read(output, REFERENCE) != written:
+            found.append(f"{backend.name}: different tiddlers once written")
+    return found
+
+
+def main() -> None:
+    """Run the checks"""
+    parser = argparse.ArgumentParser(description="HTML backends equivalence checks")
+    parser.add_argument("--pages", type=int, default=5, help="Synthetic pages")
+    parser.add_argument("--source", help="Also check the HTML files of a built book")
+    parser.add_argument("--wiki", help="Also check this TiddlyWiki file")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+    generator = random.Random(args.seed)
+
+    pages = [EDGE_PAGE] + [
+        synthetic_page(generator, index) for index in range(args.pages)
+    ]
+    if args.source:
+        pages += [
+            jboptim.read_file(path) for path in jboptim.get_html_files(args.source)
+        ]
+    wikis = [edge_wiki(generator)]
+    if args.wiki:
+        wikis.append(libsardine.read_file(args.wiki))
+
+    found = check_book(pages)
+    for wiki in wikis:
+        found += check_wiki(wiki)
+    backends = ", ".join(backend.name for backend in BACKENDS)
+    if found:
+        sys.exit("\n".join(["Backends not equivalent:"] + found))
+    print(f"{len(pages)} pages and {len(wikis)} wikis equivalent with {backends}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark the single-pass jboptim rule engine against one `find_all` per rule
+
+Run with `python -m benchmarks.jboptim_rules [--pages N] [--source DIR]`
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import jboptim
+
+WORDS = ["alpha", "beta", "kernel", "matrix", "vector", "model", "prior", "chain"]
+
+HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8"/>
+<title>{title}</title>
+<link href="_static/css/index.73d71520a4ca3b99cfee5594769eaaae.css" rel="stylesheet">
+<link href="_static/vendor/fontawesome/5.13.0/css/all.min.css" rel="stylesheet">
+<link rel="stylesheet" href="_static/vendor/open-sans_all/1.44.1/index.css">
+<link rel="stylesheet" href="_static/pygments.css" type="text/css" />
+<link rel="stylesheet" href="_static/sphinx-book-theme.40e2e510f6b7d1648584402491bb10fe.css" type="text/css" />
+<link rel="stylesheet" type="text/css" href="_static/togglebutton.css" />
+<link rel="stylesheet" type="text/css" href="_static/copybutton.css" />
+<link rel="stylesheet" type="text/css" href="_static/mystnb.css" />
+<script src="_static/js/index.3da636dd464baa7582d2.js"></script>
+<script src="_static/jquery.js"></script>
+<script src="_static/clipboard.min.js"></script>
+<script src="_static/copybutton.js"></script>
+<script src="_static/sphinx-thebe.js"></script>
+<script type="text/x-thebe-config">{{ requestKernel: true }}</script>
+<link rel="index" title="Index" href="genindex.html" />
+<link rel="search" title="Search" href="search.html" />
+<link rel="next" title="Next" href="next.html" />
+<link rel="prev" title="Prev" href="prev.html" />
+</head>
+<body data-spy="scroll" data-target="#bd-toc-nav" data-offset="80">
+<div class="container-xl"><div class="row">
+<div class="col-12 col-md-3 bd-sidebar site-navigation show" id="site-navigation">
+<form class="bd-search d-flex align-items-center" action="search.html" method="get">
+<input type="search" name="q"></form>
+<nav class="bd-links"><ul class="nav sidenav_l1">{nav}</ul></nav>
+</div>
+<main class="col py-md-3 pl-md-4 bd-content overflow-auto" role="main">
+<div class="topbar container-xl fixed-top"><div class="col pl-2 topbar-main">
+<div class="dropdown-buttons-trigger"><button>Download</button></div>
+<a class="colab-button" href="https://colab.research.google.com">Colab</a>
+</div></div>
+<div id="main-content" class="row"><div class="col-12 col-md-9 pl-md-3 pr-md-0">
+<div class="section" id="{slug}"><h1>{title}</h1>
+{sections}
+</div>
+</div></div>
+</main>
+</div></div>
+<footer class="footer mt-5 mt-md-0"><div class="container"><p>By Someone</p></div></footer>
+</body>
+</html>
+"""
+
+
+def synthetic_page(rnd: random.Random, index: int, sections: int = 20) -> str:
+    """A Jupyter Book page with prose and code cells with outputs"""
+    parts = []
+    for section in range(sections):
+        code = "\n".join(
+            f"x_{line} = {rnd.choice(WORDS)}({line})"
+            for line in range(rnd.randint(2, 8))
+        )
+        hidden = "tag_hide-input " if rnd.random() < 0.3 else ""
+        parts.append(
+            f'<div class="section" id="s{index}-{section}"><h2>Section {section}</h2>\n'
+            f"<p>{' '.join(rnd.choices(WORDS, k=80))} $x^2$</p>\n"
+            f'<div class="cell {hidden}docutils container">\n'
+            '<div class="cell_input docutils container">\n'
+            f'<div class="highlight"><pre>{code}\n</pre></div>\n'
+            '<a class="copybtn" data-tooltip="Copy">copy</a></div>\n'
+            '<div class="cell_output docutils container">\n'
+            f'<table border="1"><tr><td>{rnd.random()}</td></tr></table>\n'
+            "</div>\n</div>\n</div>"
+        )
+    nav = "".join(
+        f'<li class="toctree-l1"><a href="p{page}.html">Page {page}</a></li>'
+        for page in range(40)
+    )
+    return HEAD.format(
+        title=f"Page {index}",
+        slug=f"page-{index}",
+        nav=nav,
+        sections="\n".join(parts),
+    )
+
+
+def per_rule_passes(doc: Any, config: Dict[str, Any]) -> None:
+    """The rules applied as jboptim previously did, with a `find_all` per rule"""
+    for rule in config["remove"]:
+        jboptim.remove_elements(doc, rule["tag"], rule["attrs"])
+    for rule in config["update"]:
+        for name, value in rule["set"].items():
+            jboptim.update_tag(doc, rule["tag"], rule["attrs"], name, value)
+    for rule in config["insert"]:
+        for element in doc.find_all(rule["tag"], rule["attrs"]):
+            element.insert(rule["position"], jboptim.parse_html(rule["html"]))
+    for html in config["head"]:
+        jboptim.append_to_head(doc, html)
+    for html in config["after_body"]:
+        jboptim.append_after_body(doc, html)
+
+
+def timed(method: Callable[[Any], None], pages: List[str]) -> Tuple[float, List[str]]:
+    """Apply `method` to the parsed pages, timing only the transformation"""
+    docs = [jboptim.parse_html(page) for page in pages]
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            for doc in docs:
+                method(doc)
+            elapsed = time.perf_counter() - start
+    return elapsed, [doc.prettify() for doc in docs]
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="jboptim rule engine benchmark")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic pages")
+    parser.add_argument("--sections", type=int, default=20, help="Sections per page")
+    parser.add_argument("--source", help="Use the HTML files of a built book instead")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    if args.source:
+        pages = [
+            jboptim.read_file(path) for path in jboptim.get_html_files(args.source)
+        ]
+    else:
+        generator = random.Random(args.seed)
+        pages = [
+            synthetic_page(generator, index, args.sections)
+            for index in range(args.pages)
+        ]
+    size = sum(len(page) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {size:.1f} MB")
+
+    rules = jboptim.RuleSet(jboptim.DEFAULT_RULES)
+    legacy_time, expected = timed(
+        lambda doc: per_rule_passes(doc, jboptim.DEFAULT_RULES), pages
+    )
+    new_time, actual = timed(rules.apply, pages)
+    assert expected == actual, "the rule engine output differs from per-rule passes"
+    for name, elapsed in (("per-rule passes", legacy_time), ("single pass", new_time)):
+        print(f"{name:>15}: {elapsed:.2f}s ({len(pages) / elapsed:.1f} pages/s)")
+    print(f"{'speedup':>15}: {legacy_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
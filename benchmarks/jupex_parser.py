@@ -0,0 +1,132 @@
+"""Benchmark the streaming jupex notebook parser against loading the whole
+notebook with `json.loads`, on a notebook of several hundred MB of outputs
+
+Run with `python -m benchmarks.jupex_parser [--size MB] [--notebook FILE]`
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+import jupex
+from benchmarks.jboptim_rules import WORDS
+
+
+def write_notebook(path: str, rnd: random.Random, size: int) -> None:
+    """Write a notebook of about `size` MB, mostly base64 images and long text
+    outputs, one cell at a time"""
+    image = base64.b64encode(os.urandom(1 << 20)).decode("ascii")
+    written = 0
+    with open(path, "w", encoding="utf-8") as notebook:
+        notebook.write('{\n "cells": [\n')
+        index = 0
+        while written < size << 20:
+            source = ["# Notebook\n"] if index == 0 else [f"## Section {index}\n"]
+            source += [" ".join(rnd.choices(WORDS, k=30)) + "\n" for _ in range(10)]
+            code = [f"x_{line} = {rnd.choice(WORDS)}({line})\n" for line in range(8)]
+            outputs = [
+                {
+                    "output_type": "stream",
+                    "name": "stdout",
+                    "text": [f'{rnd.random()} "{rnd.choice(WORDS)}"\n'] * 2000,
+                },
+                {
+                    "output_type": "display_data",
+                    "metadata": {},
+                    "data": {"image/png": image, "text/plain": ["<Figure>"]},
+                },
+            ]
+            cells = [
+                {"cell_type": "markdown", "metadata": {}, "source": source},
+                {
+                    "cell_type": "code",
+                    "execution_count": index,
+                    "metadata": {"tags": ["hide-input"]},
+                    "outputs": outputs,
+                    "source": code,
+                },
+            ]
+            for cell in cells:
+                text = json.dumps(cell, indent=1)
+                notebook.write((",\n" if written else "") + text)
+                written += len(text)
+            index += 1
+        notebook.write(
+            '\n ],\n "metadata": {},\n "nbformat": 4,\n "nbformat_minor": 4\n}\n'
+        )
+
+
+def load_notebook(path: str) -> jupex.Notebook:
+    """The notebook as jupex previously read it, loading the whole JSON"""
+    with open(path, "r", encoding="utf-8") as notebook_file:
+        data = json.loads(notebook_file.read())
+    notebook = jupex.Notebook()
+    for cell in data["cells"]:
+        if cell["cell_type"] == "markdown":
+            markdown = jupex.MarkdownCell()
+            markdown.contents = cell["source"]
+            notebook.cells.append(markdown)
+            if not notebook.title and markdown.contents[0].startswith("# "):
+                notebook.title = markdown.contents[0][2:]
+        elif cell["cell_type"] == "code":
+            code = jupex.SourceCell()
+            code.contents = cell["source"]
+            notebook.cells.append(code)
+    return notebook
+
+
+def measured(method: Callable[[str], Any], path: str) -> Tuple[float, int, Any]:
+    """Wall time and peak memory (traced separately) of parsing a notebook"""
+    start = time.perf_counter()
+    result = method(path)
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = method(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def summary(notebook: jupex.Notebook) -> List[Any]:
+    """What a parsed notebook holds, to compare parsers"""
+    return [notebook.title] + [
+        (type(cell).__name__, cell.contents) for cell in notebook.cells
+    ]
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="jupex notebook parser benchmark")
+    parser.add_argument("--size", type=int, default=300, help="Notebook size in MB")
+    parser.add_argument("--notebook", help="Use this notebook instead")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = args.notebook
+        if not path:
+            path = os.path.join(folder, "synthetic.ipynb")
+            write_notebook(path, random.Random(args.seed), args.size)
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+        results = {}
+        for name, method in (
+            ("json.loads", load_notebook),
+            ("streaming", jupex.parse_notebook),
+        ):
+            results[name] = measured(method, path)
+        expected, actual = (summary(result[2]) for result in results.values())
+        assert expected == actual, "the streaming parser reads a different notebook"
+        print(f"{len(actual) - 1} cells")
+        for name, (elapsed, peak, _) in results.items():
+            print(f"{name:>10}: {elapsed:.2f}s, peak memory {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 """Common filesystem operation"""
 # INFO: Common filesystem operation
+import hashlib
 from pathlib import Path
 from typing import Generator
 
@@ -10,3 +11,12 @@ def get_all_files(root: str, extension: str = "*.md") -> Generator:
     @rtype: object
     """
     return Path(root).rglob(extension)
+
+
+def file_hash(path: str) -> str:
+    """Hash of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as content:
+        for block in iter(lambda: content.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
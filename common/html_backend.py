@@ -0,0 +1,70 @@
+"""Selectable parsers and serializers for Beautiful Soup documents"""
+# INFO: Selectable parsers and serializers for Beautiful Soup documents
+from typing import Any, Iterator, List, NamedTuple, Tuple
+
+from bs4 import BeautifulSoup, Comment, Doctype, NavigableString, Tag  # type: ignore
+
+PARSERS = ("html.parser", "lxml")
+SERIALIZERS = ("prettify", "compact")
+
+
+class Backend(NamedTuple):
+    """How documents are parsed (the pure Python `html.parser` or the much faster
+    `lxml`) and serialized (`prettify`, indenting every element, or `compact`,
+    keeping the document's own whitespace)"""
+
+    parser: str = "html.parser"
+    serializer: str = "prettify"
+
+    def parse(self, html: str) -> BeautifulSoup:
+        """Parse a document"""
+        if self.parser not in PARSERS:
+            raise ValueError(f"Unknown parser {self.parser}, use one of {PARSERS}")
+        return BeautifulSoup(html, features=self.parser)
+
+    def serialize(self, doc: BeautifulSoup, formatter: Any = "minimal") -> str:
+        """Serialize a document"""
+        if self.serializer == "prettify":
+            return doc.prettify(formatter=formatter)
+        if self.serializer == "compact":
+            return doc.decode(formatter=formatter)
+        raise ValueError(
+            f"Unknown serializer {self.serializer}, use one of {SERIALIZERS}"
+        )
+
+    @property
+    def name(self) -> str:
+        """Parser and serializer, as in `lxml+compact`"""
+        return f"{self.parser}+{self.serializer}"
+
+
+def _canonical(doc: BeautifulSoup) -> Iterator[Tuple[Any, ...]]:
+    """Elements, with their attributes, and texts of a document, ignoring
+    whitespace between and within texts"""
+    for node in doc.descendants:
+        if isinstance(node, Tag):
+            attrs = sorted(
+                (name, " ".join(value) if isinstance(value, list) else value)
+                for name, value in node.attrs.items()
+            )
+            yield ("element", node.name, tuple(attrs))
+        elif isinstance(node, (Comment, Doctype)):
+            yield (type(node).__name__, " ".join(node.split()))
+        elif isinstance(node, NavigableString) and node.strip():
+            yield ("text", " ".join(node.split()))
+
+
+def differences(first: str, second: str, limit: int = 5) -> List[str]:
+    """How two HTML documents differ in structure, attributes or text (ignoring
+    whitespace and indentation), empty if they are equivalent"""
+    found = []
+    ones = list(_canonical(BeautifulSoup(first, features="html.parser")))
+    others = list(_canonical(BeautifulSoup(second, features="html.parser")))
+    for position, (one, other) in enumerate(zip(ones, others)):
+        if one != other:
+            found.append(f"node {position}: {one} != {other}")
+            if len(found) >= limit:
+                return found
+    if len(ones) != len(others):
+        found.append(f"{len(ones)} nodes != {len(others)} nodes")
+    return found
@@ -1,13 +1,45 @@
 """Optimise Jupyter books"""
 # INFO: Optimise Jupyter books
-# pylint: disable=E0401,R1732
-from typing import Dict, List, Union
+# pylint: disable=E0401,R1732,R0913
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Match,
+    NamedTuple,
+    Optional,
+    Union,
+)
+import contextlib
 import glob
 import argparse
+import hashlib
+import io
+import json
 import os.path
+import posixpath
+import re
+import time
 
-from bs4 import BeautifulSoup  # type: ignore
+from bs4 import BeautifulSoup, Tag  # type: ignore
 from colorama import init, Fore, Style  # type: ignore
+from csscompressor import compress  # type: ignore
+from jsmin import jsmin  # type: ignore
+
+from common.fs import file_hash
+from common.html_backend import PARSERS, SERIALIZERS, Backend
+
+try:
+    import tomllib  # type: ignore
+except ImportError:
+    try:
+        import toml as tomllib  # type: ignore
+    except ImportError:
+        tomllib = None  # type: ignore
 
 
 def action_log(colour, message: str, context: str, char: str = "├─") -> str:
@@ -28,9 +60,9 @@ def get_html_files(src: str) -> List[str]:
     return _html_files
 
 
-def parse_html(html: str) -> BeautifulSoup:
+def parse_html(html: str, backend: Backend = Backend()) -> BeautifulSoup:
     """Parse the HTML with Beautiful Soup"""
-    return BeautifulSoup(html, features="html.parser")
+    return backend.parse(html)
 
 
 def remove_elements(
@@ -58,12 +90,14 @@ def remove_elements(
         )
 
 
-def save_doc(doc: BeautifulSoup, dest: str) -> None:
-    """Save a doc as an HTML"""
+def save_doc(doc: BeautifulSoup, dest: str, backend: Backend = Backend()) -> str:
+    """Save a doc as an HTML, returning the HTML"""
     print(action_log(Style.BRIGHT, "[SAVING]", f"Saving file to: {dest}", char="└─"))
+    html = backend.serialize(doc)
     text_file = open(dest, "w")
-    _ = text_file.write(doc.prettify())
+    _ = text_file.write(html)
     text_file.close()
+    return html
 
 
 def append_to_head(doc: BeautifulSoup, html: str) -> None:
@@ -131,165 +165,122 @@ def change_footer(doc: BeautifulSoup):
         footer_inner[0].attrs["class"] = ""
 
 
-if __name__ == "__main__":
-    parser: argparse.ArgumentParser = argparse.ArgumentParser(
-        description="jboptim CLI utility.", prog="jboptim"
-    )
-    parser.add_argument(
-        "--source",
-        dest="source",
-        action="store",
-        help="Where to find the built HTML",
-    )
-
-    parser.add_argument(
-        "--dest",
-        dest="destination",
-        action="store",
-        help="Where to put the built HTML",
-    )
-
-    args: argparse.Namespace = parser.parse_args()
-
-    html_files = get_html_files(args.source)
-    init(autoreset=True)  # start colour ouput
-    for html_file in html_files:
-        print(f"{Style.BRIGHT}Processing {html_file}")
-        source = read_file(html_file)
-        soup = parse_html(source)
-
-        # remove index links
-        remove_elements(soup, "link", {"rel": "index"})
-        remove_elements(soup, "link", {"rel": "search"})
-        remove_elements(soup, "link", {"rel": "next"})
-        remove_elements(soup, "link", {"rel": "prev"})
-        remove_elements(soup, "a", {"class": "colab-button"})
-        remove_elements(soup, "a", {"class": "binder-button"})
-        remove_elements(
-            soup, "script", {"src": "https://unpkg.com/thebelab@latest/lib/index.js"}
-        )
-
-        remove_elements(
-            soup, "script", {"src": "_static/js/index.3da636dd464baa7582d2.js"}
-        )
-        remove_elements(soup, "script", {"type": "text/x-thebe-config"})
-        remove_elements(soup, "link", {"href": "_static/sphinx-thebe.css"})
-        remove_elements(soup, "script", {"src": "_static/sphinx-thebe.js"})
-        remove_elements(
-            soup,
-            "link",
-            {"href": "_static/vendor/fontawesome/5.13.0/webfonts/fa-solid-900.woff2"},
-        )
-        remove_elements(
-            soup, "link", {"href": "_static/vendor/open-sans_all/1.44.1/index.css"}
-        )
-        remove_elements(
-            soup, "link", {"href": "_static/vendor/lato_latin-ext/1.44.1/index.css"}
-        )
-
-        remove_elements(
-            soup,
-            "link",
-            {"href": "_static/css/index.73d71520a4ca3b99cfee5594769eaaae.css"},
-        )
-        remove_elements(
-            soup,
-            "link",
-            {"href": "_static/vendor/fontawesome/5.13.0/webfonts/fa-brands-400.woff2"},
-        )
-        remove_elements(
-            soup, "link", {"href": "_static/vendor/fontawesome/5.13.0/css/all.min.css"}
-        )
-        remove_elements(soup, "div", {"class": "dropdown-buttons-trigger"})
-        remove_elements(soup, "a", {"data-tooltip": "Copy"})
-        remove_elements(soup, "a", {"class": "copybtn"})
-        remove_elements(soup, "link", {"href": "_static/copybutton.css"})
-        remove_elements(soup, "script", {"src": "_static/copybutton.js"})
-        remove_elements(soup, "script", {"src": "_static/clipboard.min.js"})
-        remove_elements(soup, "link", {"href": "_static/pygments.css"})
-        remove_elements(soup, "link", {"href": "_static/togglebutton.css"})
-        remove_elements(soup, "form", {"action": "search.html"})
-
-        remove_elements(
-            soup,
-            "div",
-            {"class": ["col", "pl-2", "topbar-main"]},
-        )
-
-        remove_elements(
-            soup,
-            "link",
-            {"href": "_static/sphinx-book-theme.40e2e510f6b7d1648584402491bb10fe.css"},
-        )
-
-        append_to_head(
-            soup,
-            '<link rel="preload" as="font" type="font/woff2"'
-            + ' crossorigin="" href="/fonts/JuliaMono-Regular.woff2">',
-        )
-
-        append_to_head(
-            soup,
-            '<link rel="preload" as="font" type="font/woff"'
-            + ' crossorigin="" href="_static/icomoon.woff">',
-        )
-        append_to_head(soup, '<link rel="stylesheet" href="_static/icomoon.css">')
-
-        append_to_head(soup, '<link rel="stylesheet" href="/css/style.css">')
-        append_to_head(soup, '<link rel="stylesheet" href="/css/trac.css">')
-
-        append_to_head(
-            soup, "<style>.container { padding-left: 0 !important; }</style>"
-        )
-
-        update_tag(soup, "div", {"id": "site-navigation"}, "id", "sidebar")
-
-        update_tag(soup, "div", {"id": "main-content"}, "class", "container")
-
-        update_tag(soup, "div", {"id": "main-content"}, "id", "content")
-        update_tag(soup, "div", {"id": "content"}, "class", "container")
-        update_tag(soup, "table", {"border": "1"}, "border", "0")
-
-        # update code cell blocks
-        update_tag(
-            soup,
-            "div",
-            {"class": "cell tag_hide-input docutils container"},
-            "class",
-            "cell tag_hide-input docutils",
-        )
-        update_tag(
-            soup,
-            "div",
-            {"class": "cell_input docutils container"},
-            "class",
-            "cell_input docutils",
-        )
-        update_tag(
-            soup,
-            "div",
-            {"class": "cell_output docutils container"},
-            "class",
-            "cell_output docutils",
-        )
-        update_tag(
-            soup,
-            "div",
-            {"class": "cell docutils container"},
-            "class",
-            "cell docutils",
-        )
-
-        update_tag(soup, "div", {"id": "content"}, "class", "container")
-
-        # add MathJax
-        append_to_head(
-            soup,
-            '<script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>',
-        )
-        append_to_head(
-            soup,
-            """
+# The optimisations, as they would be written in a rules file (see `load_rules`):
+# elements to remove, attributes to set, HTML to insert into elements, and HTML
+# added at the top of <head> and after the start of <body>
+DEFAULT_RULES: Dict[str, Any] = {
+    "remove": [
+        # index links
+        {"tag": "link", "attrs": {"rel": "index"}},
+        {"tag": "link", "attrs": {"rel": "search"}},
+        {"tag": "link", "attrs": {"rel": "next"}},
+        {"tag": "link", "attrs": {"rel": "prev"}},
+        {"tag": "a", "attrs": {"class": "colab-button"}},
+        {"tag": "a", "attrs": {"class": "binder-button"}},
+        {
+            "tag": "script",
+            "attrs": {"src": "https://unpkg.com/thebelab@latest/lib/index.js"},
+        },
+        {"tag": "script", "attrs": {"src": "_static/js/index.3da636dd464baa7582d2.js"}},
+        {"tag": "script", "attrs": {"type": "text/x-thebe-config"}},
+        {"tag": "link", "attrs": {"href": "_static/sphinx-thebe.css"}},
+        {"tag": "script", "attrs": {"src": "_static/sphinx-thebe.js"}},
+        {
+            "tag": "link",
+            "attrs": {
+                "href": "_static/vendor/fontawesome/5.13.0/webfonts/fa-solid-900.woff2"
+            },
+        },
+        {
+            "tag": "link",
+            "attrs": {"href": "_static/vendor/open-sans_all/1.44.1/index.css"},
+        },
+        {
+            "tag": "link",
+            "attrs": {"href": "_static/vendor/lato_latin-ext/1.44.1/index.css"},
+        },
+        {
+            "tag": "link",
+            "attrs": {"href": "_static/css/index.73d71520a4ca3b99cfee5594769eaaae.css"},
+        },
+        {
+            "tag": "link",
+            "attrs": {
+                "href": "_static/vendor/fontawesome/5.13.0/webfonts/fa-brands-400.woff2"
+            },
+        },
+        {
+            "tag": "link",
+            "attrs": {"href": "_static/vendor/fontawesome/5.13.0/css/all.min.css"},
+        },
+        {"tag": "div", "attrs": {"class": "dropdown-buttons-trigger"}},
+        {"tag": "a", "attrs": {"data-tooltip": "Copy"}},
+        {"tag": "a", "attrs": {"class": "copybtn"}},
+        {"tag": "link", "attrs": {"href": "_static/copybutton.css"}},
+        {"tag": "script", "attrs": {"src": "_static/copybutton.js"}},
+        {"tag": "script", "attrs": {"src": "_static/clipboard.min.js"}},
+        {"tag": "link", "attrs": {"href": "_static/pygments.css"}},
+        {"tag": "link", "attrs": {"href": "_static/togglebutton.css"}},
+        {"tag": "form", "attrs": {"action": "search.html"}},
+        {"tag": "div", "attrs": {"class": ["col", "pl-2", "topbar-main"]}},
+        {
+            "tag": "link",
+            "attrs": {
+                "href": "_static/sphinx-book-theme.40e2e510f6b7d1648584402491bb10fe.css"
+            },
+        },
+    ],
+    "update": [
+        {"tag": "div", "attrs": {"id": "site-navigation"}, "set": {"id": "sidebar"}},
+        {"tag": "div", "attrs": {"id": "main-content"}, "set": {"class": "container"}},
+        {"tag": "div", "attrs": {"id": "main-content"}, "set": {"id": "content"}},
+        {"tag": "div", "attrs": {"id": "content"}, "set": {"class": "container"}},
+        {"tag": "table", "attrs": {"border": "1"}, "set": {"border": "0"}},
+        # code cell blocks
+        {
+            "tag": "div",
+            "attrs": {"class": "cell tag_hide-input docutils container"},
+            "set": {"class": "cell tag_hide-input docutils"},
+        },
+        {
+            "tag": "div",
+            "attrs": {"class": "cell_input docutils container"},
+            "set": {"class": "cell_input docutils"},
+        },
+        {
+            "tag": "div",
+            "attrs": {"class": "cell_output docutils container"},
+            "set": {"class": "cell_output docutils"},
+        },
+        {
+            "tag": "div",
+            "attrs": {"class": "cell docutils container"},
+            "set": {"class": "cell docutils"},
+        },
+        {"tag": "div", "attrs": {"id": "content"}, "set": {"class": "container"}},
+    ],
+    "insert": [
+        # hidden input buttons
+        {
+            "tag": "div",
+            "attrs": {"class": "cell tag_hide-input docutils"},
+            "position": 1,
+            "html": '<button class="input-toggle" onclick="hideButton(this)">'
+            + "show</button>",
+        },
+    ],
+    "head": [
+        '<link rel="preload" as="font" type="font/woff2"'
+        + ' crossorigin="" href="/fonts/JuliaMono-Regular.woff2">',
+        '<link rel="preload" as="font" type="font/woff"'
+        + ' crossorigin="" href="_static/icomoon.woff">',
+        '<link rel="stylesheet" href="_static/icomoon.css">',
+        '<link rel="stylesheet" href="/css/style.css">',
+        '<link rel="stylesheet" href="/css/trac.css">',
+        "<style>.container { padding-left: 0 !important; }</style>",
+        # MathJax
+        '<script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>',
+        """
         <script type="text/x-mathjax-config">
             MathJax.Hub.Config({
                 tex2jax: {
@@ -299,20 +290,14 @@ if __name__ == "__main__":
             });
         </script>
         """,
-        )
-
-        append_to_head(
-            soup,
-            """
+        """
             <script type="text/javascript"
             src="https://cdn.mathjax.org/mathjax/latest/MathJax.js?config=TeX-AMS-MML_HTMLorMML">
             </script>
         """,
-        )
-
-        append_after_body(
-            soup,
-            """
+    ],
+    "after_body": [
+        """
          <script>
                let hideButton = function(element) {
           const element_to_hide = element.nextElementSibling;
@@ -369,10 +354,604 @@ if __name__ == "__main__":
   }, false);
 </script>
         """,
+    ],
+}
+
+
+def load_rules(path: str) -> Dict[str, Any]:
+    """Read rules from a JSON or (with Python 3.11+ or the `toml` package)
+    TOML file, in the format of `DEFAULT_RULES`"""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError(f"Reading {path} needs Python 3.11+ or the toml package")
+        with open(path, "rb") as rules_file:
+            return tomllib.loads(rules_file.read().decode("utf-8"))
+    with open(path, "r", encoding="utf-8") as rules_file:
+        return json.load(rules_file)
+
+
+def attribute_matches(
+    value: Union[None, str, List[str]], expected: Union[str, List[str]]
+) -> bool:
+    """Does an attribute value match, as in `find_all`: any of the expected values
+    equal to the value, or for multi-valued attributes (`class`, `rel`) to one of
+    its values or all of them joined by spaces"""
+    if value is None:
+        return False
+    values = [value] if isinstance(value, str) else list(value) + [" ".join(value)]
+    wanted = [expected] if isinstance(expected, str) else expected
+    return any(item in values for item in wanted)
+
+
+class Rule(NamedTuple):
+    """Remove, update (`changes`) or insert `html` into elements named `tag`
+    whose attributes match `attrs`"""
+
+    kind: str
+    tag: str
+    attrs: Dict[str, Union[str, List[str]]]
+    changes: Dict[str, str]
+    html: str
+    position: int
+
+    def matches(self, element: Tag) -> bool:
+        """Does the element match the rule"""
+        return all(
+            attribute_matches(element.attrs.get(name), expected)
+            for name, expected in self.attrs.items()
+        )
+
+
+class RuleSet:
+    """Rules compiled into an index by tag name, to apply them all while walking
+    a page once. Elements are removed, then updated, then inserted into, in the
+    order of the rules, so later rules see the changes of earlier ones."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.rules: List[Rule] = []
+        for kind in ("remove", "update", "insert"):
+            for rule in config.get(kind, []):
+                self.rules.append(
+                    Rule(
+                        kind,
+                        rule["tag"],
+                        rule.get("attrs", {}),
+                        rule.get("set", {}),
+                        rule.get("html", ""),
+                        rule.get("position", 0),
+                    )
+                )
+        self.by_tag: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            self.by_tag.setdefault(rule.tag, []).append(index)
+        self.head: List[str] = config.get("head", [])
+        self.after_body: List[str] = config.get("after_body", [])
+
+    def digest(self) -> str:
+        """Hash of the rules, to rebuild pages when they change"""
+        config = json.dumps(self.config, sort_keys=True)
+        return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+    def walk(self, doc: BeautifulSoup) -> List[int]:
+        """Apply the element rules in one pass over the page, returning how many
+        elements each rule matched"""
+        counts = [0] * len(self.rules)
+        stack = [child for child in reversed(doc.contents) if isinstance(child, Tag)]
+        while stack:
+            element = stack.pop()
+            removed = False
+            for index in self.by_tag.get(element.name, ()):
+                rule = self.rules[index]
+                if not rule.matches(element):
+                    continue
+                counts[index] += 1
+                if rule.kind == "remove":
+                    element.decompose()
+                    removed = True
+                    break
+                if rule.kind == "update":
+                    element.attrs.update(rule.changes)
+                else:
+                    element.insert(
+                        rule.position, BeautifulSoup(rule.html, features="html.parser")
+                    )
+            if not removed:
+                stack.extend(
+                    child
+                    for child in reversed(element.contents)
+                    if isinstance(child, Tag)
+                )
+        return counts
+
+    def apply(self, doc: BeautifulSoup) -> None:
+        """Apply all rules to a page, logging what each changed"""
+        counts = self.walk(doc)
+        for rule, count in zip(self.rules, counts):
+            log_rule(rule, count)
+        for html in self.head:
+            append_to_head(doc, html)
+        for html in self.after_body:
+            append_after_body(doc, html)
+
+
+def log_rule(rule: Rule, count: int) -> None:
+    """Log how many elements a rule changed"""
+    if count == 0:
+        print(
+            action_log(
+                Style.DIM,
+                "[NO MATCH]",
+                f"No elements found matching {rule.tag} [{rule.attrs}]",
+            )
+        )
+    elif rule.kind == "remove":
+        print(
+            action_log(
+                Fore.RED,
+                "[REMOVING]",
+                f"Found {count} matching {rule.tag} [{rule.attrs}]",
+            )
+        )
+    elif rule.kind == "update":
+        print(
+            action_log(
+                Fore.YELLOW,
+                "[UPDATE]",
+                f"Updating {count} elements{Style.NORMAL} matching "
+                f"{rule.tag} [{rule.attrs}]",
+            )
+        )
+    else:
+        print(
+            action_log(
+                Fore.GREEN,
+                "[APPEND]",
+                f"Inserting into {count} elements matching {rule.tag} [{rule.attrs}]",
+            )
+        )
+
+
+def optimise(doc: BeautifulSoup, rules: RuleSet) -> None:
+    """Apply all the optimisations to a page"""
+    rules.apply(doc)
+    change_footer(doc)
+
+
+def text_hash(text: str) -> str:
+    """Hash of a text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BuildCache:
+    """Hashes of each page's source and output in the last build, with the hash
+    of the rules used, kept in the destination to only rebuild changed pages"""
+
+    FILE_NAME = ".jboptim-cache.json"
+
+    def __init__(self, destination: str, rules_digest: str):
+        self.destination = destination
+        self.path = os.path.join(destination, self.FILE_NAME)
+        self.rules_digest = rules_digest
+        self.entries: Dict[str, Dict[str, str]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                self.entries = json.load(cache_file).get("pages", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def up_to_date(self, name: str, source_hash: str) -> bool:
+        """Was the page built from the same source and rules, and is its output
+        still as it was written"""
+        entry = self.entries.get(name)
+        if entry is None or entry.get("source") != source_hash:
+            return False
+        if entry.get("rules") != self.rules_digest:
+            return False
+        output = os.path.join(self.destination, name)
+        return os.path.exists(output) and text_hash(read_file(output)) == entry.get(
+            "output"
+        )
+
+    def record(self, name: str, source_hash: str, output_hash: str) -> None:
+        """Remember how a page was built"""
+        self.entries[name] = {
+            "source": source_hash,
+            "rules": self.rules_digest,
+            "output": output_hash,
+        }
+
+    def remove_stale(self, names: Iterable[str]) -> List[str]:
+        """Delete the outputs of pages whose source is gone, returning their paths"""
+        current = set(names)
+        removed = []
+        for name in [name for name in self.entries if name not in current]:
+            output = os.path.join(self.destination, name)
+            if os.path.exists(output):
+                os.remove(output)
+                removed.append(output)
+            del self.entries[name]
+        return removed
+
+    def save(self) -> None:
+        """Write the cache, atomically"""
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as cache_file:
+            json.dump({"pages": self.entries}, cache_file, indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+
+# Bundles, and inline scripts and styles moved to files, go to this folder
+BUNDLE_FOLDER = "_bundles"
+# Inline scripts and styles at least this long are moved to files
+INLINE_THRESHOLD = 512
+_JS_TYPES = ("", "text/javascript", "application/javascript")
+_BUNDLE_URL = re.compile(BUNDLE_FOLDER + r"/([\w.-]+)")
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def is_local(url: str) -> bool:
+    """Is the URL relative to the page"""
+    return not (url.startswith(("/", "#", "data:")) or "://" in url)
+
+
+def minify_js(code: str) -> str:
+    """Minified JavaScript, keeping template literals as they are"""
+    return jsmin(code, quote_chars="'\"`")
+
+
+def assets_digest(folder: str) -> str:
+    """Hash of all the stylesheets and scripts in a folder, to rebuild the
+    bundles when one of them changes"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith((".css", ".js")):
+                path = os.path.join(root, name)
+                digest.update(
+                    f"{os.path.relpath(path, folder)}:{file_hash(path)}\n".encode()
+                )
+    return digest.hexdigest()
+
+
+def _runs(elements: List[Tag]) -> Iterator[List[Tag]]:
+    """Elements grouped into runs of adjacent siblings"""
+    run: List[Tag] = []
+    for element in elements:
+        if run and run[-1].find_next_sibling() is not element:
+            yield run
+            run = []
+        run.append(element)
+    if run:
+        yield run
+
+
+class Bundler(NamedTuple):
+    """Replace each run of adjacent local stylesheets, or scripts, of a page with
+    one minified bundle, and move large inline scripts and styles to minified
+    files. Files are named by the hash of their content, in `destination`/_bundles,
+    so pages share them and browsers can cache them."""
+
+    source: str
+    destination: str
+
+    def local_file(self, url: str) -> Optional[str]:
+        """Path of the file a URL relative to the pages refers to, if it exists"""
+        url = url.split("#", 1)[0].split("?", 1)[0]
+        if not url or not is_local(url):
+            return None
+        path = os.path.normpath(os.path.join(self.source, url))
+        return path if os.path.isfile(path) else None
+
+    def write(self, kind: str, extension: str, content: str) -> str:
+        """Write a file named by its content, returning its URL"""
+        name = f"{kind}.{text_hash(content)[:16]}.{extension}"
+        folder = os.path.join(self.destination, BUNDLE_FOLDER)
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            # Pages are processed in parallel, so write under a name of our own
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, "w", encoding="utf-8") as bundle:
+                bundle.write(content)
+            os.replace(temp, path)
+        return f"{BUNDLE_FOLDER}/{name}"
+
+    def stylesheet(self, url: str) -> str:
+        """Minified stylesheet, with its relative URLs rebased on the bundle folder"""
+        folder = posixpath.dirname(url.split("?", 1)[0])
+
+        def rebase(match: Match) -> str:
+            quote, target = match.group(1), match.group(2).strip()
+            if not is_local(target):
+                return match.group(0)
+            target = posixpath.normpath(posixpath.join(folder, target))
+            return f"url({quote}../{target}{quote})"
+
+        return compress(_CSS_URL.sub(rebase, read_asset(self.local_file(url))))
+
+    def script(self, url: str) -> str:
+        """Minified script"""
+        return minify_js(read_asset(self.local_file(url)))
+
+    def apply(self, doc: BeautifulSoup) -> None:
+        """Bundle the assets of a page"""
+        stylesheets = [
+            link
+            for link in doc.find_all("link", href=True)
+            if "stylesheet" in (link.get("rel") or [])
+            and self.local_file(str(link["href"]))
+        ]
+        for run in _runs(stylesheets):
+            content = "\n".join(self.stylesheet(str(link["href"])) for link in run)
+            url = self.write("styles", "css", content)
+            self.replace(run, doc.new_tag("link", rel="stylesheet", href=url))
+        scripts = [
+            script
+            for script in doc.find_all("script", src=True)
+            if script.get("type", "") in _JS_TYPES
+            and not script.has_attr("async")
+            and not script.has_attr("defer")
+            and self.local_file(str(script["src"]))
+        ]
+        for run in _runs(scripts):
+            content = ";\n".join(self.script(str(script["src"])) for script in run)
+            url = self.write("scripts", "js", content)
+            self.replace(run, doc.new_tag("script", src=url))
+        self.move_inline(doc)
+
+    def move_inline(self, doc: BeautifulSoup) -> None:
+        """Move large inline scripts and styles to files"""
+        for script in doc.find_all("script", src=False):
+            code = script.string or ""
+            if script.get("type", "") in _JS_TYPES and len(code) >= INLINE_THRESHOLD:
+                url = self.write("inline", "js", minify_js(code))
+                print(action_log(Fore.GREEN, "[BUNDLE]", f"inline script into {url}"))
+                script.clear()
+                script["src"] = url
+        for style in doc.find_all("style"):
+            code = style.string or ""
+            if len(code) >= INLINE_THRESHOLD:
+                url = self.write("inline", "css", compress(code))
+                print(action_log(Fore.GREEN, "[BUNDLE]", f"inline style into {url}"))
+                style.replace_with(doc.new_tag("link", rel="stylesheet", href=url))
+
+    @staticmethod
+    def replace(run: List[Tag], bundle: Tag) -> None:
+        """Replace a run of elements with their bundle"""
+        print(
+            action_log(
+                Fore.GREEN,
+                "[BUNDLE]",
+                f"{len(run)} {run[0].name} elements into {bundle.get('href') or bundle.get('src')}",
+            )
+        )
+        run[0].replace_with(bundle)
+        for element in run[1:]:
+            element.decompose()
+
+
+def prune_bundles(destination: str, pages: Iterable[str]) -> List[str]:
+    """Delete the bundles no page refers to any more, returning their names"""
+    folder = os.path.join(destination, BUNDLE_FOLDER)
+    if not os.path.isdir(folder):
+        return []
+    referenced = set()
+    for page in pages:
+        path = os.path.join(destination, page)
+        if os.path.exists(path):
+            referenced.update(_BUNDLE_URL.findall(read_file(path)))
+    unused = sorted(set(os.listdir(folder)) - referenced)
+    for name in unused:
+        os.remove(os.path.join(folder, name))
+    return unused
+
+
+def read_asset(path: Optional[str]) -> str:
+    """Content of a stylesheet or script"""
+    if path is None:
+        return ""
+    with open(path, "r", encoding="utf-8", errors="replace") as asset:
+        return asset.read()
+
+
+class Processed(NamedTuple):
+    """Result of optimising one page"""
+
+    path: str
+    log: List[str]
+    seconds: float
+    size: int
+    output_hash: str
+
+
+def process_file(
+    html_file: str,
+    destination: str,
+    rules: RuleSet,
+    backend: Backend = Backend(),
+    bundle: bool = False,
+) -> Processed:
+    """Optimise one page, capturing its console output so pages processed
+    in parallel are still logged one after the other"""
+    start = time.perf_counter()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        print(f"{Style.BRIGHT}Processing {html_file}")
+        source = read_file(html_file)
+        soup = parse_html(source, backend)
+        optimise(soup, rules)
+        if bundle:
+            Bundler(os.path.dirname(html_file), destination).apply(soup)
+        html_file_dest = os.path.join(destination, os.path.basename(html_file))
+        html = save_doc(soup, html_file_dest, backend)
+    return Processed(
+        html_file,
+        output.getvalue().splitlines(),
+        time.perf_counter() - start,
+        len(source),
+        text_hash(html),
+    )
+
+
+def process_files(
+    paths: List[str],
+    destination: str,
+    rules: RuleSet,
+    *,
+    jobs: int = 1,
+    backend: Backend = Backend(),
+    bundle: bool = False,
+) -> Iterator[Processed]:
+    """Optimise pages, in `jobs` processes, yielding results in the pages' order"""
+    if jobs <= 1:
+        for path in paths:
+            yield process_file(path, destination, rules, backend, bundle)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(
+            process_file,
+            paths,
+            repeat(destination),
+            repeat(rules),
+            repeat(backend),
+            repeat(bundle),
+            chunksize=4,
         )
 
-        append_buttons(soup)
-        change_footer(soup)
 
-        html_file_dest = os.path.join(args.destination, os.path.basename(html_file))
-        save_doc(soup, html_file_dest)
+def print_summary(
+    pages: List[Processed], elapsed: float, unchanged: int = 0, slowest: int = 5
+) -> None:
+    """Print the slowest pages and the overall throughput"""
+    if unchanged:
+        print(f"{Style.BRIGHT}Skipped {unchanged} unchanged pages")
+    if not pages:
+        print("No HTML files found" if not unchanged else "Nothing to optimise")
+        return
+    print(f"{Style.BRIGHT}Slowest pages:")
+    for page in sorted(pages, key=lambda page: -page.seconds)[:slowest]:
+        print(f"  {page.seconds:7.3f}s {page.path}")
+    total = sum(page.size for page in pages)
+    busy = sum(page.seconds for page in pages)
+    print(
+        f"{Style.BRIGHT}Optimised {len(pages)} pages "
+        f"({total / 1e6:.1f} MB) in {elapsed:.2f}s: "
+        f"{len(pages) / elapsed:.1f} pages/s, {total / 1e6 / elapsed:.2f} MB/s, "
+        f"{busy / len(pages):.3f}s per page"
+    )
+
+
+if __name__ == "__main__":
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description="jboptim CLI utility.", prog="jboptim"
+    )
+    parser.add_argument(
+        "--source",
+        dest="source",
+        action="store",
+        help="Where to find the built HTML",
+    )
+
+    parser.add_argument(
+        "--dest",
+        dest="destination",
+        action="store",
+        help="Where to put the built HTML",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of processes optimising pages (0 for one per CPU)",
+    )
+
+    parser.add_argument(
+        "--rules",
+        dest="rules",
+        action="store",
+        help="JSON or TOML file with the optimisation rules (built-in ones otherwise)",
+    )
+
+    parser.add_argument(
+        "--force",
+        dest="force",
+        action="store_true",
+        help="Optimise all pages, even unchanged ones",
+    )
+
+    parser.add_argument(
+        "--parser",
+        dest="parser",
+        choices=PARSERS,
+        default="html.parser",
+        help="HTML parser (lxml is much faster)",
+    )
+
+    parser.add_argument(
+        "--serializer",
+        dest="serializer",
+        choices=SERIALIZERS,
+        default="prettify",
+        help="Indent the HTML (prettify) or keep its whitespace (compact, smaller)",
+    )
+
+    parser.add_argument(
+        "--bundle",
+        dest="bundle",
+        action="store_true",
+        help=f"Bundle and minify local stylesheets and scripts into {BUNDLE_FOLDER}",
+    )
+
+    args: argparse.Namespace = parser.parse_args()
+
+    html_files = get_html_files(args.source)
+    init(autoreset=True)  # start colour ouput
+    started = time.perf_counter()
+    rule_set = RuleSet(load_rules(args.rules) if args.rules else DEFAULT_RULES)
+    html_backend = Backend(args.parser, args.serializer)
+    # Pages are rebuilt when the rules, the backend or bundled assets change
+    build_digest = f"{rule_set.digest()}:{html_backend.name}"
+    if args.bundle:
+        build_digest += f":{assets_digest(args.source)}"
+    cache = BuildCache(args.destination, build_digest)
+    for stale_output in cache.remove_stale(
+        os.path.basename(path) for path in html_files
+    ):
+        print(action_log(Fore.RED, "[DELETED]", f"Source is gone: {stale_output}"))
+    source_hashes = {path: file_hash(path) for path in html_files}
+    changed = [
+        path
+        for path in html_files
+        if args.force
+        or not cache.up_to_date(os.path.basename(path), source_hashes[path])
+    ]
+    processed = []
+    try:
+        for processed_file in process_files(
+            changed,
+            args.destination,
+            rule_set,
+            jobs=args.jobs or os.cpu_count() or 1,
+            backend=html_backend,
+            bundle=args.bundle,
+        ):
+            for line in processed_file.log:
+                print(line)
+            processed.append(processed_file)
+            cache.record(
+                os.path.basename(processed_file.path),
+                source_hashes[processed_file.path],
+                processed_file.output_hash,
+            )
+    finally:
+        cache.save()
+    if args.bundle:
+        for bundle_name in prune_bundles(args.destination, cache.entries):
+            print(action_log(Fore.RED, "[DELETED]", f"Unused bundle {bundle_name}"))
+    print_summary(
+        processed, time.perf_counter() - started, len(html_files) - len(changed)
+    )
@@ -1,8 +1,13 @@
 """Utility to convert Jupyter to Markdown"""
 # INFO: utility to convert Jupyter to Markdown
 # pylint: disable=R0903
-from typing import List, Union
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, TextIO
+from typing import Tuple, Union
+import base64
+import hashlib
 import json
+import os
+import re
 
 
 class Notebook:
@@ -12,54 +17,330 @@ class Notebook:
         self.cells: List[Union[MarkdownCell, SourceCell]] = []
         self.title: str = ""
 
+    def jupyter_md(self) -> Iterator[str]:
+        """Jupyter markdown of the notebook, a fragment at a time"""
+        for cell in self.cells:
+            yield from cell.jupyter_md()
+
+    def write_jupyter_md(self, sink: TextIO) -> None:
+        """Write the notebook as Jupyter markdown to a file-like object, without
+        building the whole text"""
+        sink.writelines(self.jupyter_md())
+
     def to_jupyter_md(self) -> str:
         """Convert Jupyter notebook to Jupyter markdown"""
-        markdown = ""
-        for cell in self.cells:
-            if isinstance(cell, MarkdownCell):
-                markdown += "%% md\n"
-                markdown += "".join(cell.contents) + "\n"
-            elif isinstance(cell, SourceCell):
-                markdown += "%% python\n"
-                markdown += "".join(cell.contents) + "\n"
-                markdown += "\n"
-        return markdown
+        return "".join(self.jupyter_md())
 
 
 class MarkdownCell:
     """Represents a markdown cell"""
 
+    __slots__ = ("contents",)
+
     def __init__(self):
         self.contents: str = ""
 
+    def jupyter_md(self) -> Iterator[str]:
+        """The cell in Jupyter markdown"""
+        yield "%% md\n"
+        yield "".join(self.contents) + "\n"
+
 
 class SourceCell:
     """Represents a code cell"""
 
+    __slots__ = ("contents", "outputs")
+
     def __init__(self):
         self.contents: str = ""
+        self.outputs: List[Union[TextOutput, ImageOutput]] = []
+
+    def jupyter_md(self) -> Iterator[str]:
+        """The cell in Jupyter markdown, followed by a markdown cell with its
+        outputs if it has any"""
+        yield "%% python\n"
+        yield "".join(self.contents) + "\n\n"
+        if self.outputs:
+            yield "%% md\n"
+            for output in self.outputs:
+                yield output.markdown()
+
+
+# Longest text output kept, in characters
+MAX_TEXT = 10000
+
+
+class TextOutput:
+    """Represents a text output of a code cell"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str = ""):
+        self.text = text
+
+    def markdown(self) -> str:
+        """The output as an indented code block"""
+        lines = self.text.splitlines() or [""]
+        return "".join(f"    {line}\n" for line in lines) + "\n"
+
+
+class ImageOutput:
+    """Represents an image output of a code cell, saved to a file"""
+
+    __slots__ = ("url",)
+
+    def __init__(self, url: str = ""):
+        self.url = url
+
+    def markdown(self) -> str:
+        """The output as a markdown image"""
+        return f"![output]({self.url})\n\n"
+
+
+class OutputStore(NamedTuple):
+    """Where images of outputs are saved (`folder`) and served from (`url`),
+    and the longest text output kept"""
+
+    folder: str
+    url: str
+    max_text: int = MAX_TEXT
+
+    def image(self, data: bytes, extension: str) -> str:
+        """Save an image named by its content, once for all notebooks, returning
+        its URL"""
+        name = f"{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+        path = os.path.join(self.folder, name)
+        if not os.path.exists(path):
+            os.makedirs(self.folder, exist_ok=True)
+            # Notebooks may be parsed in parallel, so write under a name of our own
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, "wb") as image:
+                image.write(data)
+            os.replace(temp, path)
+        return f"{self.url}{name}"
+
+    def text(self, text: str) -> TextOutput:
+        """A text output, truncated to `max_text` characters"""
+        if len(text) > self.max_text:
+            hidden = len(text) - self.max_text
+            text = f"{text[: self.max_text]}\n... ({hidden} more characters)"
+        return TextOutput(text)
+
+    def outputs(self, output: Dict[str, Any]) -> List[Union[TextOutput, ImageOutput]]:
+        """Outputs to show for an output of a notebook: images (PNG preferred to
+        SVG) or else plain text of results, streams and error messages"""
+        if output.get("output_type") == "stream":
+            return [self.text("".join(output.get("text", "")))]
+        if output.get("output_type") == "error":
+            return [self.text(f"{output.get('ename')}: {output.get('evalue')}")]
+        data = output.get("data", {})
+        if "image/png" in data:
+            png = base64.b64decode("".join(data["image/png"]))
+            return [ImageOutput(self.image(png, "png"))]
+        if "image/svg+xml" in data:
+            svg = "".join(data["image/svg+xml"]).encode("utf-8")
+            return [ImageOutput(self.image(svg, "svg"))]
+        if "text/plain" in data:
+            return [self.text("".join(data["text/plain"]))]
+        return []
+
+
+# Characters read from a notebook at a time
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SCALARS = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_LITERAL_END = re.compile(r"[ \t\n\r,}\]]")
+
+
+class JsonScanner:
+    """Reads a JSON document a chunk at a time, to load some of its values and
+    skip the others without holding them in memory"""
+
+    def __init__(self, file: TextIO, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+
+    def _more(self) -> bool:
+        """Read the next chunk, dropping what was consumed"""
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """The next character that is not whitespace, without consuming it"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()  # type: ignore
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._more():
+                raise ValueError("Unexpected end of JSON document")
+
+    def _next(self, expected: str) -> str:
+        char = self.peek()
+        if char not in expected:
+            raise ValueError(f"Expected one of {expected!r}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def members(self) -> Iterator[str]:
+        """Keys of the object starting here. Each key's value must be loaded or
+        skipped before getting the next one."""
+        self._next("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self._next(":")
+            yield key
+            if self._next(",}") == "}":
+                return
+
+    def items(self) -> Iterator[None]:
+        """Go over the items of the array starting here, each of which must be
+        loaded or skipped before getting the next one"""
+        self._next("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield None
+            if self._next(",]") == "]":
+                return
+
+    def _keep(self, pieces: Optional[List[str]], start: int) -> bool:
+        """Add the text read since `start` to `pieces` and read the next chunk"""
+        if pieces is not None:
+            pieces.append(self.buffer[start : self.pos])
+        return self._more()
+
+    def _scan_literal(self, pieces: Optional[List[str]]) -> None:
+        """Go over the number, true, false or null starting here, which may end
+        the document"""
+        start = self.pos
+        match = _LITERAL_END.search(self.buffer, self.pos)
+        while match is None:
+            self.pos = len(self.buffer)
+            if not self._keep(pieces, start):
+                return
+            start = 0
+            match = _LITERAL_END.search(self.buffer)
+        self.pos = match.start()
+        if pieces is not None:
+            pieces.append(self.buffer[start : self.pos])
+
+    def _scan_string(self, pieces: Optional[List[str]], start: int) -> int:
+        """Go over the string starting here, which may span several chunks.
+        Returns where the text to add to `pieces` now starts."""
+        # str.find is much faster than a regular expression on long strings
+        self.pos += 1
+        end = self.buffer.find('"', self.pos)
+        while True:
+            escape = self.buffer.find("\\", self.pos, None if end < 0 else end)
+            if escape < 0 <= end:
+                self.pos = end + 1
+                return start
+            if 0 <= escape < len(self.buffer) - 1:
+                self.pos = escape + 2
+                if 0 <= end < self.pos:
+                    end = self.buffer.find('"', self.pos)
+                continue
+            # Continue in the next chunk, from the escape missing its character
+            # if there is one
+            self.pos = len(self.buffer) if escape < 0 else escape
+            if not self._keep(pieces, start):
+                raise ValueError("Unexpected end of JSON document")
+            start = 0
+            end = self.buffer.find('"', self.pos)
+
+    def _scan(self, pieces: Optional[List[str]]) -> None:
+        """Go over the value starting here, adding its text to `pieces`"""
+        if self.peek() not in '"{[':
+            self._scan_literal(pieces)
+            return
+        start = self.pos
+        depth = 0
+        while True:
+            if depth:
+                # Everything up to the next bracket, or string continuing in
+                # the next chunk
+                self.pos = _SCALARS.match(self.buffer, self.pos).end()  # type: ignore
+            if self.pos == len(self.buffer):
+                if not self._keep(pieces, start):
+                    raise ValueError("Unexpected end of JSON document")
+                start = 0
+                continue
+            char = self.buffer[self.pos]
+            if char == '"':
+                start = self._scan_string(pieces, start)
+            else:
+                depth += 1 if char in "{[" else -1
+                self.pos += 1
+            if depth == 0:
+                break
+        if pieces is not None:
+            pieces.append(self.buffer[start : self.pos])
+
+    def value(self) -> Any:
+        """Load the value starting here"""
+        pieces: List[str] = []
+        self._scan(pieces)
+        return json.loads("".join(pieces))
+
+    def skip(self) -> None:
+        """Skip the value starting here, reading through it without keeping it"""
+        self._scan(None)
+
 
+def read_cells(
+    path: str, read_output: Optional[Callable[[Dict[str, Any]], List[Any]]] = None
+) -> Iterator[Tuple[str, Any, List[Any]]]:
+    """Type, source and outputs (each one converted by `read_output` as soon as it
+    is loaded, none without it) of a notebook's cells, read incrementally: anything
+    else is skipped, so memory use depends on the largest cell rather than the
+    notebook's size"""
+    with open(path, "r", encoding="utf-8") as _notebook_file:
+        scanner = JsonScanner(_notebook_file)
+        for key in scanner.members():
+            if key != "cells":
+                scanner.skip()
+                continue
+            for _ in scanner.items():
+                cell_type, source, cell_outputs = "", None, []
+                for field in scanner.members():
+                    if field == "cell_type":
+                        cell_type = scanner.value()
+                    elif field == "source":
+                        source = scanner.value()
+                    elif field == "outputs" and read_output is not None:
+                        for _ in scanner.items():
+                            cell_outputs.extend(read_output(scanner.value()))
+                    else:
+                        scanner.skip()
+                yield cell_type, source, cell_outputs
 
-def parse_notebook(path: str) -> Notebook:
-    """Parse a file into a Notebook"""
-    with open(path, "r") as _notebook_file:
-        data = _notebook_file.read()
 
+def parse_notebook(path: str, store: Optional[OutputStore] = None) -> Notebook:
+    """Parse a file into a Notebook, with the outputs of code cells if there is
+    a `store` for their images"""
     first_cell = True
-    notebook_json = json.loads(data)
     _notebook = Notebook()
-    for cell_json in notebook_json["cells"]:
-        cell_type = cell_json["cell_type"]
+    read_output = None if store is None else store.outputs
+    for cell_type, source, outputs in read_cells(path, read_output):
         if cell_type == "markdown":
             md_cell = MarkdownCell()
-            md_cell.contents = cell_json["source"]
+            md_cell.contents = source
             _notebook.cells.append(md_cell)
             if first_cell and md_cell.contents[0].startswith("# "):
                 _notebook.title = md_cell.contents[0][2:]
                 first_cell = False
         elif cell_type == "code":
             code_cell = SourceCell()
-            code_cell.contents = cell_json["source"]
+            code_cell.contents = source
+            code_cell.outputs = outputs
             _notebook.cells.append(code_cell)
 
     return _notebook
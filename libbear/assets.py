@@ -0,0 +1,148 @@
+"""Incremental, deduplicated copies of Bear note images"""
+# pylint: disable=R0902
+import ctypes
+import ctypes.util
+import fcntl
+import json
+import os
+import shutil
+import sys
+import threading
+from typing import Dict, Iterable, List, Set
+
+from common.fs import file_hash
+
+# ioctl to share the data blocks of two files on Linux (btrfs, xfs, ...)
+_FICLONE = 0x40049409
+
+
+def clone_file(source: str, target: str) -> bool:
+    """Copy-on-write copy of `source` to a new `target`, if the filesystem supports it"""
+    try:
+        if sys.platform == "darwin":
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            return libc.clonefile(os.fsencode(source), os.fsencode(target), 0) == 0
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except (OSError, AttributeError):
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+
+class AssetStore:
+    """Folder of exported images which is only written to when an image changed.
+    Identical images are hard linked, others cloned or copied."""
+
+    def __init__(self, root: str, index_file: str):
+        self.root = root
+        self.index_file = index_file
+        # Asset name -> size and modification time of its source and content hash
+        self.index: Dict[str, List] = {}
+        self.by_digest: Dict[str, str] = {}
+        self.copied = 0
+        self.linked = 0
+        self.skipped = 0
+        self.removed = 0
+        self.bytes_copied = 0
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """Load the index of exported assets"""
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as index:
+                self.index = json.load(index)
+        except (OSError, ValueError):
+            self.index = {}
+        self.by_digest = {entry[2]: name for name, entry in self.index.items()}
+
+    def save(self) -> None:
+        """Save the index of exported assets"""
+        parent = os.path.dirname(self.index_file)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        temp = self.index_file + ".tmp"
+        with open(temp, "w", encoding="utf-8") as index:
+            json.dump(self.index, index)
+        os.replace(temp, self.index_file)
+
+    def place(self, source: str, name: str) -> bool:
+        """Export `source` as asset `name`, unless it is already there.
+        Returns whether the asset was written."""
+        with self.lock:
+            return self._place(source, name)
+
+    def _place(self, source: str, name: str) -> bool:
+        try:
+            stat = os.stat(source)
+        except FileNotFoundError:
+            return False
+        target = os.path.join(self.root, name)
+        entry = self.index.get(name)
+        target_size = os.path.getsize(target) if os.path.exists(target) else -1
+        if (
+            entry is not None
+            and entry[0] == stat.st_size
+            and entry[1] == stat.st_mtime_ns
+            and target_size == stat.st_size
+        ):
+            self.skipped += 1
+            return False
+        digest = file_hash(source)
+        self.index[name] = [stat.st_size, stat.st_mtime_ns, digest]
+        if target_size == stat.st_size and file_hash(target) == digest:
+            self.skipped += 1
+            self.by_digest[digest] = name
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp = target + ".tmp"
+        if os.path.exists(temp):
+            os.remove(temp)
+        if not self._link_duplicate(digest, name, temp):
+            if not clone_file(source, temp):
+                shutil.copyfile(source, temp)
+            self.copied += 1
+            self.bytes_copied += stat.st_size
+        os.utime(temp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temp, target)
+        self.by_digest[digest] = name
+        return True
+
+    def _link_duplicate(self, digest: str, name: str, temp: str) -> bool:
+        """Hard link an exported asset with the same content"""
+        duplicate = self.by_digest.get(digest)
+        if duplicate is None or duplicate == name:
+            return False
+        existing = os.path.join(self.root, duplicate)
+        try:
+            if file_hash(existing) != digest:
+                return False
+            os.link(existing, temp)
+        except OSError:
+            return False
+        self.linked += 1
+        return True
+
+    def sync(self, source_root: str, names: Iterable[str]) -> int:
+        """Export the named assets from `source_root`, returning how many were written"""
+        return sum(
+            1 for name in names if self.place(os.path.join(source_root, name), name)
+        )
+
+    def collect(self, referenced: Set[str]) -> int:
+        """Delete exported assets which are not referenced anymore"""
+        removed = 0
+        for folder, _, files in os.walk(self.root, topdown=False):
+            for filename in files:
+                path = os.path.join(folder, filename)
+                name = os.path.relpath(path, self.root)
+                if name not in referenced:
+                    os.remove(path)
+                    self.index.pop(name, None)
+                    removed += 1
+            if folder != self.root and not os.listdir(folder):
+                os.rmdir(folder)
+        self.by_digest = {entry[2]: name for name, entry in self.index.items()}
+        self.removed += removed
+        return removed
@@ -0,0 +1,112 @@
+"""Long-running Bear sync, watching the Bear database and the export folder"""
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Optional, Tuple
+
+from libbear.sync import BearSync
+
+logger = logging.getLogger("bear")
+
+
+@dataclass
+class CycleStats:
+    """Timing and queue depth of a single sync cycle"""
+
+    started: float
+    duration: float
+    queued_files: int
+    db_changed: bool
+    notes_exported: Optional[int] = None
+    error: Optional[str] = None
+
+
+class SyncDaemon:
+    """Runs `BearSync` cycles whenever the Bear database or exported files change,
+    polling less often while idle"""
+
+    def __init__(
+        self,
+        bear_sync: Optional[BearSync] = None,
+        min_interval: float = 1.0,
+        max_interval: float = 60.0,
+        history: int = 100,
+    ):
+        self.bear_sync = bear_sync or BearSync()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.stats: Deque[CycleStats] = deque(maxlen=history)
+        self.db_state: Optional[Tuple[Tuple[int, int], ...]] = None
+        self.running = False
+
+    def db_signature(self) -> Tuple[Tuple[int, int], ...]:
+        """Modification time and size of the database and its write-ahead log"""
+        signature = []
+        for path in (self.bear_sync.bear_db, self.bear_sync.bear_db + "-wal"):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append((0, 0))
+        return tuple(signature)
+
+    def poll(self) -> Tuple[int, bool]:
+        """Number of changed exported files and whether the database changed"""
+        queued = self.bear_sync.change_journal().pending()
+        return queued, self.db_signature() != self.db_state
+
+    def run_cycle(self, queued: int, db_changed: bool) -> CycleStats:
+        """Run one sync cycle"""
+        started = time.time()
+        stats = CycleStats(
+            started=started, duration=0.0, queued_files=queued, db_changed=db_changed
+        )
+        try:
+            # Read before syncing, so changes made meanwhile trigger another cycle
+            self.db_state = self.db_signature()
+            stats.notes_exported = self.bear_sync.sync_cycle()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Sync cycle failed")
+            stats.error = str(error)
+            # Retry on the next poll
+            self.db_state = None
+        stats.duration = time.time() - started
+        self.stats.append(stats)
+        logger.info(
+            "Sync cycle took %.2fs (%s queued files, database changed: %s)",
+            stats.duration,
+            queued,
+            db_changed,
+        )
+        return stats
+
+    def run(self, max_cycles: Optional[int] = None) -> None:
+        """Watch and sync until interrupted (or `max_cycles` cycles ran)"""
+        self.running = True
+        cycles = 0
+        try:
+            while self.running and (max_cycles is None or cycles < max_cycles):
+                queued, db_changed = self.poll()
+                if queued or db_changed:
+                    stats = self.run_cycle(queued, db_changed)
+                    cycles += 1
+                    if stats.error is None:
+                        self.interval = self.min_interval
+                    else:
+                        self.interval = min(self.interval * 2, self.max_interval)
+                else:
+                    self.interval = min(self.interval * 2, self.max_interval)
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+        finally:
+            self.running = False
+            if self.bear_sync.journal is not None:
+                self.bear_sync.journal.close()
+                self.bear_sync.journal = None
+            if self.bear_sync.connection is not None:
+                self.bear_sync.connection.close()
+                self.bear_sync.connection = None
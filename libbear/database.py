@@ -1,24 +1,42 @@
 """Bear database handling methods"""
-# pylint: disable=E1101
+# pylint: disable=E1101,R0913
 import sqlite3
+from datetime import datetime, timezone
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Dict, List
-import re
-from collections import Counter
+from typing import Dict, Iterator, List, Optional, Union
+
+from libbear import duplicates
+from libbear.note_cache import NoteCache
 
 HOME: str = str(Path.home())
+CACHE_PATH: str = f"{HOME}/.cache/bear/notes.sqlite"
+# Bear dates are seconds since 2001-01-01 (Core Data timestamps)
+BEAR_EPOCH: datetime = datetime(2001, 1, 1, tzinfo=timezone.utc)
+
+_CACHE: Optional[NoteCache] = None
 
 
 @dataclass
 class Task:
     """Class to hold information about a single task"""
 
+    __slots__ = ("identifier", "task", "title")
+
     identifier: str
     task: str
     title: str
 
 
+@dataclass
+class SearchResult:
+    """Class to hold a single full-text search match"""
+
+    identifier: str
+    title: str
+    snippet: str
+
+
 def get_connection() -> sqlite3.Connection:
     """Return a connection"""
     return sqlite3.connect(
@@ -27,55 +45,110 @@ def get_connection() -> sqlite3.Connection:
     )
 
 
+def get_cache(conn: sqlite3.Connection) -> NoteCache:
+    """Return the note cache, brought up to date with the Bear database"""
+    global _CACHE  # pylint: disable=global-statement
+    if _CACHE is None:
+        _CACHE = NoteCache(CACHE_PATH)
+    _CACHE.refresh(conn)
+    return _CACHE
+
+
+def to_bear_date(date: Union[datetime, float]) -> float:
+    """Bear timestamp of a datetime (naive ones are local time)"""
+    if isinstance(date, datetime):
+        return date.astimezone(timezone.utc).timestamp() - BEAR_EPOCH.timestamp()
+    return date
+
+
 def get_titles(conn: sqlite3.Connection) -> List[str]:
     """Get all titles"""
-    cur = conn.cursor()
-    cur.execute("SELECT ZTITLE FROM ZSFNOTE")
-
-    rows = cur.fetchall()
-    return [row[0] for row in rows]
+    return get_cache(conn).titles()
 
 
 def get_all_notes_text(conn: sqlite3.Connection) -> List[str]:
     """Get all notes' text"""
-    cur = conn.cursor()
-    cur.execute("SELECT ZTEXT FROM ZSFNOTE")
-
-    rows = cur.fetchall()
-    return [row[0] for row in rows]
+    return list(iter_notes_text(conn))
+
+
+def iter_notes_text(
+    conn: sqlite3.Connection,
+    *,
+    trashed: Optional[bool] = None,
+    archived: Optional[bool] = None,
+    tag: Optional[str] = None,
+    modified_since: Optional[Union[datetime, float]] = None,
+    batch_size: int = 500,
+) -> Iterator[str]:
+    """Stream notes' text, optionally only (not) trashed or archived notes, notes
+    with a tag (or its sub-tags), or notes modified after a date"""
+    yield from get_cache(conn).iter_texts(
+        batch_size,
+        trashed=trashed,
+        archived=archived,
+        tag=tag,
+        modified_since=None if modified_since is None else to_bear_date(modified_since),
+    )
 
 
 def get_all_tasks(conn: sqlite3.Connection) -> Dict[str, List[Task]]:
     """Get all tasks"""
-    cur = conn.cursor()
-    cur.execute("SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT FROM ZSFNOTE")
-    rows = cur.fetchall()
-
     tasks: Dict[str, List[Task]] = {}
 
-    for row in rows:
-        _tasks: List[str] = re.findall(r"- \[ \] (.*)", row[2])
-        if len(_tasks) > 0:
-            if row[1] not in tasks:
-                tasks[row[1]] = []
-            for match in _tasks:
-                task = Task(identifier=row[0], title=row[1], task=match)
-
-                tasks[row[1]].append(task)
+    for task in iter_tasks(conn):
+        tasks.setdefault(task.title, []).append(task)
     return tasks
 
 
+def iter_tasks(
+    conn: sqlite3.Connection,
+    *,
+    trashed: Optional[bool] = None,
+    archived: Optional[bool] = None,
+    tag: Optional[str] = None,
+    modified_since: Optional[Union[datetime, float]] = None,
+    batch_size: int = 500,
+) -> Iterator[Task]:
+    """Stream open tasks, with the same filters as `iter_notes_text`"""
+    rows = get_cache(conn).iter_tasks(
+        batch_size,
+        trashed=trashed,
+        archived=archived,
+        tag=tag,
+        modified_since=None if modified_since is None else to_bear_date(modified_since),
+    )
+    for identifier, title, match in rows:
+        yield Task(identifier=identifier, title=title, task=match)
+
+
 def get_duplicate_titles(conn: sqlite3.Connection) -> None:
     """Get all duplicate titles"""
-    cur = conn.cursor()
-    cur.execute("SELECT ZTITLE FROM ZSFNOTE")
+    total = 0
+    for title, count in get_cache(conn).duplicate_titles():
+        print(f"{title}: {count}")
+        total += count - 1
+    print("-" * 80)
+    print(f"Total: {total}")
+
 
-    rows = cur.fetchall()
-    counts = Counter([row[0] for row in rows])
+def search(conn: sqlite3.Connection, query: str, limit: int = 50) -> List[SearchResult]:
+    """Full-text search of notes' titles and text, best matches first"""
+    return [
+        SearchResult(identifier=identifier, title=title, snippet=snippet)
+        for identifier, title, snippet in get_cache(conn).search(query, limit)
+    ]
+
+
+def get_near_duplicates(conn: sqlite3.Connection, threshold: float = 0.8) -> None:
+    """Get clusters of notes with similar text, ignoring trashed notes"""
+    signatures = get_cache(conn).signatures(
+        duplicates.SIGNATURE_VERSION, duplicates.signature, trashed=False
+    )
     total = 0
-    for pair in counts.items():
-        if pair[1] > 1:
-            print(f"{pair[0]}: {pair[1]}")
-            total += pair[1] - 1
+    for cluster in duplicates.find_clusters(signatures, threshold):
+        for _, title, score in cluster.members:
+            print(f"{score:.2f}  {title}")
+        print()
+        total += len(cluster.members) - 1
     print("-" * 80)
     print(f"Total: {total}")
@@ -0,0 +1,154 @@
+"""Rate-controlled dispatch of x-callback updates to Bear"""
+
+# pylint: disable=R0902,R0913
+import logging
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger("bear")
+
+Launcher = Callable[[List[str]], int]
+
+
+def open_launcher(args: List[str]) -> int:
+    """Hand a URL or file to Bear with macOS' `open`"""
+    return subprocess.call(["open"] + args)
+
+
+@dataclass(eq=False)
+class Update:
+    """A single update for Bear"""
+
+    args: List[str]
+    # Note expected to change, None when a note is created
+    uuid: Optional[str] = None
+    # Title of the note created
+    title: str = ""
+    sent: float = 0.0
+    before: Optional[float] = None
+
+
+@dataclass
+class DispatchStats:
+    """Outcome of sending queued updates"""
+
+    sent: int = 0
+    confirmed: int = 0
+    timed_out: int = 0
+    elapsed: float = 0.0
+    # Time spent sleeping between polls of the database
+    slept: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        """Updates confirmed per second"""
+        return self.confirmed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class XCallbackDispatcher:
+    """Sends queued updates to Bear, keeping a window of updates in flight which grows
+    while Bear confirms them and halves on timeouts. Updates are confirmed by a newer
+    ZMODIFICATIONDATE of their note, creates by a new note with their title."""
+
+    def __init__(
+        self,
+        modification_dates: Callable[[List[str]], Dict[str, float]],
+        latest_modification: Callable[[], float],
+        notes_titled: Callable[[str, float], List[str]],
+        *,
+        launcher: Launcher = open_launcher,
+        timeout: float = 5.0,
+        poll_interval: float = 0.05,
+        max_window: int = 16,
+    ):
+        self.modification_dates = modification_dates
+        self.latest_modification = latest_modification
+        self.notes_titled = notes_titled
+        self.launcher = launcher
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_window = max_window
+        self.window = 1
+        self.queue: Deque[Update] = deque()
+        # Notes confirming a create, so each confirms a single one
+        self.created: Set[str] = set()
+
+    def submit(
+        self, args: List[str], uuid: Optional[str] = None, title: str = ""
+    ) -> None:
+        """Queue an update of note `uuid`, or the creation of a note titled `title`,
+        to be sent by `flush`"""
+        self.queue.append(Update(args=args, uuid=uuid, title=title))
+
+    def flush(self) -> DispatchStats:
+        """Send all queued updates and wait for Bear to apply them"""
+        stats = DispatchStats()
+        start = time.time()
+        in_flight: List[Update] = []
+        while self.queue or in_flight:
+            if self.queue and len(in_flight) < self.window:
+                in_flight.extend(self._launch(len(in_flight), stats))
+            done = self._confirmed(in_flight)
+            now = time.time()
+            for update in in_flight:
+                if update in done:
+                    stats.confirmed += 1
+                    stats.latencies.append(now - update.sent)
+                    self.window = min(self.window + 1, self.max_window)
+                elif now - update.sent > self.timeout:
+                    target = update.uuid or update.args[-1][:80]
+                    logger.warning("No confirmation from Bear for %s", target)
+                    stats.timed_out += 1
+                    done.append(update)
+                    self.window = max(self.window // 2, 1)
+            in_flight = [update for update in in_flight if update not in done]
+            if in_flight and not done:
+                time.sleep(self.poll_interval)
+                stats.slept += self.poll_interval
+        stats.elapsed = time.time() - start
+        if stats.sent:
+            logger.debug(
+                "%s updates sent to Bear in %.2fs (%.1f/s, %s timed out)",
+                stats.sent,
+                stats.elapsed,
+                stats.throughput,
+                stats.timed_out,
+            )
+        return stats
+
+    def _launch(self, busy: int, stats: DispatchStats) -> List[Update]:
+        """Send as many queued updates as the window allows"""
+        count = min(len(self.queue), self.window - busy)
+        batch = [self.queue.popleft() for _ in range(count)]
+        before = self.modification_dates([u.uuid for u in batch if u.uuid is not None])
+        latest = self.latest_modification()
+        for update in batch:
+            update.before = before.get(update.uuid, 0.0) if update.uuid else latest
+            update.sent = time.time()
+            self.launcher(update.args)
+            stats.sent += 1
+        return batch
+
+    def _confirmed(self, in_flight: List[Update]) -> List[Update]:
+        """Updates Bear has applied"""
+        uuids = [update.uuid for update in in_flight if update.uuid is not None]
+        current = self.modification_dates(uuids) if uuids else {}
+        done = []
+        for update in in_flight:
+            if update.before is None:
+                continue
+            if update.uuid is not None:
+                modified = current.get(update.uuid)
+                if modified is not None and modified > update.before:
+                    done.append(update)
+                continue
+            for uuid in self.notes_titled(update.title, update.before):
+                if uuid not in self.created:
+                    self.created.add(uuid)
+                    done.append(update)
+                    break
+        return done
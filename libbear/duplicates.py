@@ -0,0 +1,174 @@
+"""Near-duplicate notes, found with MinHash signatures and locality-sensitive hashing"""
+import hashlib
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Signatures use one-permutation MinHash: a single 64 bit hash per shingle, whose
+# low bits pick one of NUM_BINS bins, keeping the minimum of the rest per bin.
+# Empty bins borrow the value of the next non-empty bin (rotation densification).
+NUM_BINS = 128
+SHINGLE_SIZE = 3
+# Stored with cached signatures, to recompute them when the parameters change
+SIGNATURE_VERSION = f"oph-{NUM_BINS}-{SHINGLE_SIZE}"
+# Buckets larger than this are compared against their first note only,
+# so many copies of the same note stay linear
+MAX_BUCKET = 100
+
+_BIN_BITS = NUM_BINS.bit_length() - 1
+_EMPTY = (1 << (64 - _BIN_BITS)) - 1
+_WORD = re.compile(r"\w+")
+_TITLE_NOISE = re.compile(r"(\bcopy\b|\d+$|[^\w ])")
+
+
+def normalize_title(title: str) -> str:
+    """Title without case, punctuation, "copy" or a trailing number"""
+    return " ".join(_TITLE_NOISE.sub(" ", (title or "").lower()).split())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[str]:
+    """Overlapping `size`-word sequences of a text, ignoring case and punctuation"""
+    words = _WORD.findall((text or "").lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(features: Iterable[str]) -> bytes:
+    """MinHash signature of a set of features, empty if there are none"""
+    mins = [_EMPTY] * NUM_BINS
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        slot = value & (NUM_BINS - 1)
+        value >>= _BIN_BITS
+        if value < mins[slot]:
+            mins[slot] = value
+    if all(value == _EMPTY for value in mins):
+        return b""
+    values = array("Q", mins)
+    for slot in range(NUM_BINS):
+        if mins[slot] == _EMPTY:
+            distance = next(
+                step
+                for step in range(1, NUM_BINS)
+                if mins[(slot + step) % NUM_BINS] != _EMPTY
+            )
+            values[slot] = mins[(slot + distance) % NUM_BINS] + (
+                distance << (64 - _BIN_BITS)
+            )
+    return values.tobytes()
+
+
+def signature(text: str) -> bytes:
+    """MinHash signature of a note's text"""
+    return minhash(shingles(text))
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Estimated Jaccard similarity of the notes with these signatures"""
+    if not first or not second:
+        return 0.0
+    one, other = array("Q", first), array("Q", second)
+    return sum(1 for a, b in zip(one, other) if a == b) / NUM_BINS
+
+
+def lsh_bands(threshold: float) -> Tuple[int, int]:
+    """Number of bands and rows per band whose LSH threshold, (1/bands)^(1/rows),
+    is closest below `threshold`, so few similar notes are missed"""
+    options = [
+        (NUM_BINS // rows, rows)
+        for rows in range(1, NUM_BINS + 1)
+        if NUM_BINS % rows == 0
+    ]
+    below = [
+        option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold
+    ]
+    return below[-1] if below else options[0]
+
+
+@dataclass
+class Cluster:
+    """Near-duplicate notes, with their similarity to the first note"""
+
+    members: List[Tuple[str, str, float]] = field(default_factory=list)
+
+
+class _Groups:
+    """Union-find over note indices"""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, index: int) -> int:
+        """Representative of a group"""
+        while self.parent[index] != index:
+            self.parent[index] = self.parent[self.parent[index]]
+            index = self.parent[index]
+        return index
+
+    def union(self, first: int, second: int) -> None:
+        """Merge two groups, the lower index representing them"""
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def _buckets(
+    notes: List[Tuple[str, str, bytes]], threshold: float
+) -> Iterable[List[int]]:
+    """Indices of candidate notes: LSH bands of signatures and normalized titles"""
+    bands, rows = lsh_bands(threshold)
+    width = rows * array("Q").itemsize
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    for index, (_, title, sig) in enumerate(notes):
+        if not sig:
+            continue
+        for band in range(bands):
+            key = sig[band * width : (band + 1) * width]
+            buckets.setdefault((band, key), []).append(index)
+        normalized = normalize_title(title)
+        if normalized:
+            buckets.setdefault((-1, normalized.encode()), []).append(index)
+    return (members for members in buckets.values() if len(members) > 1)
+
+
+def _pairs(members: List[int]) -> Iterable[Tuple[int, int]]:
+    if len(members) > MAX_BUCKET:
+        return ((members[0], other) for other in members[1:])
+    return (
+        (first, second)
+        for position, first in enumerate(members)
+        for second in members[position + 1 :]
+    )
+
+
+def find_clusters(
+    notes: List[Tuple[str, str, bytes]], threshold: float = 0.8
+) -> List[Cluster]:
+    """Clusters of notes, given as (uuid, title, signature), with an estimated
+    similarity of at least `threshold`. Only notes sharing an LSH bucket or a
+    normalized title are compared."""
+    groups = _Groups(len(notes))
+    compared: Set[Tuple[int, int]] = set()
+    for members in _buckets(notes, threshold):
+        for pair in _pairs(members):
+            if pair in compared or groups.find(pair[0]) == groups.find(pair[1]):
+                continue
+            compared.add(pair)
+            if similarity(notes[pair[0]][2], notes[pair[1]][2]) >= threshold:
+                groups.union(*pair)
+    by_root: Dict[int, List[int]] = {}
+    for index in range(len(notes)):
+        by_root.setdefault(groups.find(index), []).append(index)
+    clusters = []
+    for root, members in by_root.items():
+        if len(members) < 2:
+            continue
+        cluster = Cluster()
+        for index in members:
+            uuid, title, sig = notes[index]
+            cluster.members.append((uuid, title, similarity(notes[root][2], sig)))
+        clusters.append(cluster)
+    return clusters
@@ -0,0 +1,83 @@
+"""Finder tags of files, read from their extended attributes"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import plistlib
+import re
+import sys
+from typing import Dict, Iterable, List, Optional
+
+TAGS_ATTRIBUTE = "com.apple.metadata:_kMDItemUserTags"
+
+# Finder stores tags as "name\n<label color>"
+_COLOR_SUFFIX = re.compile(r"\n\d{1,2}$")
+# Errors meaning the file simply has no such attribute
+_NO_ATTRIBUTE = {errno.ENODATA, errno.ENOTSUP, getattr(errno, "ENOATTR", errno.ENODATA)}
+_LIBC = None
+
+
+def _darwin_getxattr(path: str, name: str) -> Optional[bytes]:
+    global _LIBC  # pylint: disable=global-statement
+    if _LIBC is None:
+        _LIBC = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    getxattr = _LIBC.getxattr
+    getxattr.restype = ctypes.c_ssize_t
+    getxattr.argtypes = [
+        ctypes.c_char_p,
+        ctypes.c_char_p,
+        ctypes.c_void_p,
+        ctypes.c_size_t,
+        ctypes.c_uint32,
+        ctypes.c_int,
+    ]
+    c_path, c_name = os.fsencode(path), name.encode()
+    size = getxattr(c_path, c_name, None, 0, 0, 0)
+    if size >= 0:
+        buffer = ctypes.create_string_buffer(size)
+        size = getxattr(c_path, c_name, buffer, size, 0, 0)
+        if size >= 0:
+            return buffer.raw[:size]
+    code = ctypes.get_errno()
+    if code in _NO_ATTRIBUTE:
+        return None
+    raise OSError(code, os.strerror(code), path)
+
+
+def read_xattr(path: str, name: str) -> Optional[bytes]:
+    """Value of extended attribute `name`, None if the file doesn't have it.
+    Outside macOS the attribute is read from the `user.` namespace."""
+    if sys.platform == "darwin":
+        return _darwin_getxattr(path, name)
+    try:
+        return os.getxattr(path, "user." + name)
+    except OSError as error:
+        if error.errno in _NO_ATTRIBUTE:
+            return None
+        raise
+
+
+def decode_tags(data: Optional[bytes]) -> List[str]:
+    """Tag names from a binary plist value of `_kMDItemUserTags`"""
+    if not data:
+        return []
+    try:
+        tags = plistlib.loads(data)
+    except (plistlib.InvalidFileException, ValueError):
+        return []
+    if not isinstance(tags, list):
+        return []
+    return [_COLOR_SUFFIX.sub("", tag) for tag in tags if isinstance(tag, str)]
+
+
+def file_tags(path: str) -> List[str]:
+    """Finder tags of a file or folder"""
+    try:
+        return decode_tags(read_xattr(path, TAGS_ATTRIBUTE))
+    except OSError:
+        return []
+
+
+def file_tags_batch(paths: Iterable[str]) -> Dict[str, List[str]]:
+    """Finder tags of many files, by path"""
+    return {path: file_tags(path) for path in paths}
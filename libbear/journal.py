@@ -0,0 +1,221 @@
+"""Journals of changed files in an exported Bear folder"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MARKDOWN_SUFFIXES = (".md", ".txt", ".markdown")
+
+# inotify(7) constants
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_MASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT = struct.Struct("iIII")
+
+
+class SnapshotJournal:
+    """Portable journal, diffing `os.scandir` snapshots of the folder"""
+
+    def __init__(self, root: str, suffixes: Tuple[str, ...] = MARKDOWN_SUFFIXES):
+        self.root = root
+        self.suffixes = suffixes
+        self.snapshot: Dict[str, Tuple[int, int]] = {}
+
+    def changes(self, since: float) -> Set[str]:
+        """Files added or modified since the last call, with a modification time
+        after `since`. The first call considers every file."""
+        changed = set()
+        for path in self._candidates():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.snapshot.pop(path, None)
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self.snapshot.get(path) != key:
+                self.snapshot[path] = key
+                if stat.st_mtime > since:
+                    changed.add(path)
+        return changed
+
+    def pending(self) -> int:
+        """Number of files changed since the last call to `changes`, without
+        consuming them"""
+        return self._count_changed(self._scan(self.root))
+
+    def wait_quiet(self, since: float, window: float) -> Set[str]:
+        """Wait until nothing changed in the folder for a whole `window` of seconds,
+        returning the files changed meanwhile"""
+        found: Set[str] = set()
+        last_change = time.monotonic()
+        while True:
+            remaining = last_change + window - time.monotonic()
+            if remaining <= 0:
+                return found
+            if self._wait(remaining):
+                last_change = time.monotonic()
+                found |= self.changes(since)
+
+    def refresh(self, paths: Iterable[str]) -> None:
+        """Record the current state of files we changed ourselves,
+        so they are not reported as changes"""
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                self.snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                self.snapshot.pop(path, None)
+
+    def close(self) -> None:
+        """Release any resources"""
+
+    def _wait(self, window: float) -> bool:
+        """Wait at most `window` seconds, telling if anything changed meanwhile"""
+        time.sleep(window)
+        return self.pending() > 0
+
+    def _count_changed(self, paths: Iterable[str]) -> int:
+        count = 0
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self.snapshot.get(path) != (stat.st_mtime_ns, stat.st_size):
+                count += 1
+        return count
+
+    def _candidates(self) -> Iterable[str]:
+        paths = self._scan(self.root)
+        # Forget deleted files
+        self.snapshot = {
+            path: self.snapshot[path] for path in paths if path in self.snapshot
+        }
+        return paths
+
+    def _scan(self, top: str) -> List[str]:
+        paths = []
+        folders = [top]
+        while folders:
+            folder = folders.pop()
+            self._watch(folder)
+            try:
+                entries = list(os.scandir(folder))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(entry.path)
+                elif entry.name.endswith(self.suffixes):
+                    paths.append(entry.path)
+        return paths
+
+    def _watch(self, folder: str) -> None:
+        """Hook called for every folder scanned"""
+
+
+class InotifyJournal(SnapshotJournal):
+    """Linux journal, only looking at files reported by inotify after the first scan"""
+
+    def __init__(self, root: str, suffixes: Tuple[str, ...] = MARKDOWN_SUFFIXES):
+        super().__init__(root, suffixes)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.queued: Set[str] = set()
+        # A full scan is needed at first, on queue overflow or when out of watches
+        self.rescan = True
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _wait(self, window: float) -> bool:
+        # Any event counts, such as the images of a textbundle still arriving
+        readable, _, _ = select.select([self.fd], [], [], window)
+        if not readable:
+            return False
+        self._queue_events()
+        return True
+
+    def _watch(self, folder: str) -> None:
+        descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), _IN_MASK)
+        if descriptor < 0:
+            self.rescan = True
+        else:
+            self.watches[descriptor] = folder
+
+    def pending(self) -> int:
+        self._queue_events()
+        if self.rescan:
+            return super().pending()
+        return self._count_changed(self.queued)
+
+    def _candidates(self) -> Iterable[str]:
+        if self.rescan:
+            self.rescan = False
+            # Covered by the scan
+            self._read_events()
+            self.queued.clear()
+            return super()._candidates()
+        self._queue_events()
+        if self.rescan:
+            return self._candidates()
+        paths, self.queued = self.queued, set()
+        return paths
+
+    def _queue_events(self) -> None:
+        for path, is_dir in self._read_events():
+            if is_dir:
+                self.queued.update(self._scan(path))
+            elif path.endswith(self.suffixes):
+                self.queued.add(path)
+
+    def _read_events(self) -> List[Tuple[str, bool]]:
+        events: List[Tuple[str, bool]] = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(buffer):
+                descriptor, mask, _, length = _EVENT.unpack_from(buffer, offset)
+                start = offset + _EVENT.size
+                name = buffer[start : start + length].rstrip(b"\0")
+                offset = start + length
+                if mask & _IN_Q_OVERFLOW:
+                    self.rescan = True
+                elif mask & _IN_IGNORED:
+                    self.watches.pop(descriptor, None)
+                elif descriptor in self.watches:
+                    path = os.path.join(self.watches[descriptor], os.fsdecode(name))
+                    events.append((path, bool(mask & _IN_ISDIR)))
+
+
+def change_journal(
+    root: str,
+    suffixes: Tuple[str, ...] = MARKDOWN_SUFFIXES,
+    use_inotify: Optional[bool] = None,
+) -> SnapshotJournal:
+    """Best journal for this platform: inotify on Linux, scandir snapshots elsewhere"""
+    if use_inotify is None:
+        use_inotify = sys.platform.startswith("linux")
+    if use_inotify:
+        try:
+            return InotifyJournal(root, suffixes)
+        except (OSError, AttributeError):
+            pass
+    return SnapshotJournal(root, suffixes)
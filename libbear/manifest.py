@@ -0,0 +1,105 @@
+"""Persistent record of what a Bear export wrote, used for incremental exports"""
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set
+
+
+@dataclass
+class ManifestEntry:
+    """Export state of a single note"""
+
+    modified: float
+    digest: str
+    paths: List[str] = field(default_factory=list)
+    images: List[str] = field(default_factory=list)
+
+
+def content_hash(text: str) -> str:
+    """Hash of a rendered note"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ExportManifest:
+    """Maps note UUIDs to their modification date, output paths and content hash"""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, ManifestEntry] = {}
+        self.valid = False
+
+    def load(self) -> bool:
+        """Load the manifest from disk, returning `False` if it is missing,
+        unreadable or was written with other export settings"""
+        self.entries = {}
+        self.valid = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+        except (OSError, ValueError):
+            return False
+        if data.get("fingerprint") != self.fingerprint:
+            return False
+        for uuid, entry in data.get("notes", {}).items():
+            self.entries[uuid] = ManifestEntry(**entry)
+        self.valid = True
+        return True
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk"""
+        parent = os.path.dirname(self.path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        data = {
+            "fingerprint": self.fingerprint,
+            "notes": {uuid: asdict(entry) for uuid, entry in self.entries.items()},
+        }
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as manifest_file:
+            json.dump(data, manifest_file)
+        os.replace(temp, self.path)
+        self.valid = True
+
+    def get(self, uuid: str) -> Optional[ManifestEntry]:
+        """Get the entry for a note, if any"""
+        return self.entries.get(uuid)
+
+    def set(
+        self,
+        uuid: str,
+        modified: float,
+        digest: str,
+        paths: List[str],
+        images: Optional[List[str]] = None,
+    ) -> None:
+        """Record the export state of a note"""
+        self.entries[uuid] = ManifestEntry(
+            modified=modified, digest=digest, paths=paths, images=images or []
+        )
+
+    def remove(self, uuid: str) -> None:
+        """Forget a note"""
+        self.entries.pop(uuid, None)
+
+    def changed(self, notes: Dict[str, float]) -> List[str]:
+        """UUIDs from `notes` (uuid -> modification date) that are new or modified"""
+        return [
+            uuid
+            for uuid, modified in notes.items()
+            if uuid not in self.entries or self.entries[uuid].modified != modified
+        ]
+
+    def referenced_images(self) -> Set[str]:
+        """Images referenced by exported notes"""
+        return {
+            image
+            for entry in self.entries.values()
+            if entry.paths
+            for image in entry.images
+        }
+
+    def removed(self, notes: Dict[str, float]) -> List[str]:
+        """UUIDs in the manifest which are no longer in `notes`"""
+        return [uuid for uuid in self.entries if uuid not in notes]
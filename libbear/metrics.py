@@ -0,0 +1,78 @@
+"""Timings and counters of a Bear sync run"""
+import cProfile
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class SyncMetrics:
+    """Wall time per stage and counters of one sync run, optionally profiling
+    the stages to keep the profile of the slowest one"""
+
+    def __init__(self, profile: bool = False):
+        self.started = time.time()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.profile = profile
+        self.hottest: Optional[str] = None
+        self.profiler: Optional[cProfile.Profile] = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Worker processes count into their own copy, which is discarded
+        state = self.__dict__.copy()
+        state["lock"] = None
+        state["profiler"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def count(self, name: str, amount: float = 1) -> None:
+        """Add to a counter, from any thread"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a stage (adding up if it runs several times)"""
+        profiler = cProfile.Profile() if self.profile else None
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            if profiler is not None and (
+                self.hottest is None or elapsed > self.stages.get(self.hottest, 0.0)
+            ):
+                self.hottest = name
+                self.profiler = profiler
+
+    def record(self) -> Dict[str, Any]:
+        """All metrics of the run"""
+        hottest = max(self.stages, key=self.stages.__getitem__, default=None)
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "stages": self.stages,
+            "counters": self.counters,
+            "hottest_stage": hottest,
+        }
+
+    def emit(self, path: str, profile_path: Optional[str] = None) -> str:
+        """Append the metrics to `path` as a JSON line, and dump the profile of the
+        slowest profiled stage to `profile_path`. Returns the JSON line."""
+        line = json.dumps(self.record(), sort_keys=True)
+        with open(path, "a", encoding="utf-8") as metrics:
+            metrics.write(line + "\n")
+        if profile_path and self.profiler is not None:
+            self.profiler.dump_stats(profile_path)
+        return line
@@ -0,0 +1,124 @@
+"""Make folders copies of another one, like `rsync -r -t [--delete]` does"""
+import fnmatch
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+
+@dataclass
+class MirrorStats:
+    """What mirroring a tree changed"""
+
+    copied: int = 0
+    skipped: int = 0
+    # Entries removed with `delete`: a removed folder counts once, whatever it held
+    deleted: int = 0
+    bytes_copied: int = 0
+
+    def add(self, other: "MirrorStats") -> None:
+        """Add the counts of another mirror"""
+        self.copied += other.copied
+        self.skipped += other.skipped
+        self.deleted += other.deleted
+        self.bytes_copied += other.bytes_copied
+
+
+def excluded(name: str, is_dir: bool, patterns: Iterable[str]) -> bool:
+    """Does an rsync-style pattern exclude this entry (a trailing `/` only matches
+    folders)"""
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if is_dir and fnmatch.fnmatchcase(name, pattern[:-1]):
+                return True
+        elif fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def _entries(folder: str) -> Dict[str, os.DirEntry]:
+    try:
+        with os.scandir(folder) as entries:
+            return {entry.name: entry for entry in entries}
+    except FileNotFoundError:
+        return {}
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _copy(source: os.DirEntry, target: str) -> int:
+    """Copy a file with its modification time, replacing `target` atomically"""
+    folder, name = os.path.split(target)
+    temp = os.path.join(folder, "." + name + ".mirror")
+    shutil.copyfile(source.path, temp)
+    stat = source.stat()
+    os.utime(temp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp, target)
+    return stat.st_size
+
+
+def _same_file(first: os.stat_result, second: os.stat_result) -> bool:
+    return (first.st_size, first.st_mtime_ns) == (second.st_size, second.st_mtime_ns)
+
+
+def mirror_tree(
+    source: str, dest: str, delete: bool = False, excludes: Sequence[str] = ()
+) -> MirrorStats:
+    """Copy files of `source` missing from `dest` or differing in size or
+    modification time, and with `delete` remove what is not in `source`.
+    Excluded entries are neither copied nor deleted, symbolic links are skipped."""
+    stats = MirrorStats()
+    os.makedirs(dest, exist_ok=True)
+    sources = _entries(source)
+    targets = _entries(dest)
+    if delete:
+        for name, entry in targets.items():
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if name not in sources and not excluded(name, is_dir, excludes):
+                _remove(entry.path)
+                stats.deleted += 1
+    for name, entry in sources.items():
+        if entry.is_symlink():
+            continue
+        is_dir = entry.is_dir()
+        if excluded(name, is_dir, excludes):
+            continue
+        target = os.path.join(dest, name)
+        existing = targets.get(name)
+        if existing is not None and existing.is_dir(follow_symlinks=False) != is_dir:
+            _remove(target)
+            existing = None
+        if is_dir:
+            stats.add(mirror_tree(entry.path, target, delete, excludes))
+            stat = entry.stat()
+            os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            continue
+        if existing is not None:
+            stat, current = entry.stat(), existing.stat(follow_symlinks=False)
+            if _same_file(stat, current):
+                stats.skipped += 1
+                continue
+        stats.bytes_copied += _copy(entry, target)
+        stats.copied += 1
+    return stats
+
+
+def mirror_all(
+    source: str,
+    targets: List[Tuple[str, bool]],
+    excludes: Sequence[str] = (),
+    workers: int = 4,
+) -> Dict[str, MirrorStats]:
+    """Mirror `source` to all (folder, delete) targets concurrently"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            dest: pool.submit(mirror_tree, source, dest, delete, excludes)
+            for dest, delete in targets
+        }
+        return {dest: future.result() for dest, future in futures.items()}
@@ -0,0 +1,289 @@
+"""Local, indexed copy of Bear notes with full-text search, tags and tasks"""
+import os
+import sqlite3
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from libbear.tokens import tokenize
+
+SCHEMA_VERSION = "3"
+# Notes read from Bear per query, below SQLite's limit of host parameters
+CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+-- `id` is the note's Z_PK in Bear, so notes keep Bear's order
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    uuid TEXT,
+    title TEXT,
+    text TEXT,
+    modified REAL,
+    trashed INTEGER,
+    archived INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    title, text, content='notes', content_rowid='id'
+);
+CREATE INDEX IF NOT EXISTS notes_by_modified ON notes (modified);
+CREATE TABLE IF NOT EXISTS tags (note_id INTEGER, tag TEXT);
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS tags_by_note ON tags (note_id);
+CREATE TABLE IF NOT EXISTS tasks (note_id INTEGER, position INTEGER, task TEXT);
+CREATE INDEX IF NOT EXISTS tasks_by_note ON tasks (note_id);
+-- Similarity signatures, dropped with their note when it changes
+CREATE TABLE IF NOT EXISTS signatures (note_id INTEGER PRIMARY KEY, signature BLOB);
+"""
+
+# Row of the Bear database: Z_PK, uuid, title, text, modification date, trashed
+# and archived flags
+NoteRow = Tuple[
+    int,
+    str,
+    Optional[str],
+    Optional[str],
+    Optional[float],
+    Optional[int],
+    Optional[int],
+]
+# Bear columns which, when changed, mean a note must be read again
+_VERSION = "ZMODIFICATIONDATE, ZTRASHED, ZARCHIVED"
+
+
+class NoteCache:
+    """Sidecar SQLite database mirroring ZSFNOTE, refreshed from the modification
+    dates of notes so only new and changed notes are read from Bear"""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self._create()
+
+    def _create(self) -> None:
+        version = None
+        try:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'schema'"
+            ).fetchone()
+            version = row[0] if row else None
+        except sqlite3.OperationalError:
+            pass
+        if version != SCHEMA_VERSION:
+            for table in ("meta", "notes", "notes_fts", "tags", "tasks", "signatures"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (SCHEMA_VERSION,)
+        )
+        self.conn.commit()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        value = row.fetchone()
+        return value[0] if value else None
+
+    def refresh(self, source: sqlite3.Connection) -> int:
+        """Bring the cache up to date with the Bear database `source`,
+        returning the number of notes added, changed or removed"""
+        # Changes with the modification date of any note, even an older one
+        signature = source.execute(
+            "SELECT COUNT(*), MAX(ZMODIFICATIONDATE), TOTAL(ZMODIFICATIONDATE), "
+            "TOTAL(ZTRASHED), TOTAL(ZARCHIVED) FROM ZSFNOTE"
+        ).fetchone()
+        state = ":".join(str(value) for value in signature)
+        if self._meta("state") == state:
+            return 0
+        # Synced notes can carry older modification dates than notes edited here,
+        # so compare the dates of every note rather than only looking at newer ones
+        current = {
+            row[0]: row[1:]
+            for row in source.execute(f"SELECT Z_PK, {_VERSION} FROM ZSFNOTE")
+        }
+        cached = {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT id, modified, trashed, archived FROM notes"
+            )
+        }
+        changed = [
+            note_id
+            for note_id, modified in current.items()
+            if cached.get(note_id) != modified
+        ]
+        removed = [note_id for note_id in cached if note_id not in current]
+        with self.conn:
+            for start in range(0, len(changed), CHUNK_SIZE):
+                chunk = changed[start : start + CHUNK_SIZE]
+                rows = source.execute(
+                    f"SELECT Z_PK, ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT, {_VERSION} "
+                    f"FROM ZSFNOTE WHERE Z_PK IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for row in rows:
+                    self._store(row)
+            for note_id in removed:
+                self._remove(note_id)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('state', ?)", (state,)
+            )
+        return len(changed) + len(removed)
+
+    def _remove(self, note_id: int) -> None:
+        old = self.conn.execute(
+            "SELECT title, text FROM notes WHERE id = ?", (note_id,)
+        ).fetchone()
+        if old is None:
+            return
+        self.conn.execute(
+            "INSERT INTO notes_fts (notes_fts, rowid, title, text) "
+            "VALUES ('delete', ?, ?, ?)",
+            (note_id, old[0], old[1]),
+        )
+        self.conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        self.conn.execute("DELETE FROM tags WHERE note_id = ?", (note_id,))
+        self.conn.execute("DELETE FROM tasks WHERE note_id = ?", (note_id,))
+        self.conn.execute("DELETE FROM signatures WHERE note_id = ?", (note_id,))
+
+    def _store(self, row: NoteRow) -> None:
+        note_id, _, title, text = row[:4]
+        self._remove(note_id)
+        self.conn.execute("INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        self.conn.execute(
+            "INSERT INTO notes_fts (rowid, title, text) VALUES (?, ?, ?)",
+            (note_id, title, text),
+        )
+        tokens = tokenize(text or "")
+        tags = dict.fromkeys(tokens.hash_tags + tokens.closed_tags)
+        self.conn.executemany(
+            "INSERT INTO tags VALUES (?, ?)", ((note_id, tag) for tag in tags)
+        )
+        self.conn.executemany(
+            "INSERT INTO tasks VALUES (?, ?, ?)",
+            ((note_id, position, task) for position, task in enumerate(tokens.tasks)),
+        )
+
+    def titles(self) -> List[str]:
+        """Titles of all notes"""
+        return [row[0] for row in self.conn.execute("SELECT title FROM notes")]
+
+    def iter_texts(self, batch_size: int = 500, **filters: Any) -> Iterator[str]:
+        """Text of the notes matching `filters` (see `where`)"""
+        where, params = self.where(**filters)
+        for row in self._stream(
+            f"SELECT text FROM notes WHERE {where} ORDER BY id", params, batch_size
+        ):
+            yield row[0]
+
+    def iter_tasks(
+        self, batch_size: int = 500, **filters: Any
+    ) -> Iterator[Tuple[str, str, str]]:
+        """Open tasks as (uuid, title, task), in note order, of the notes matching
+        `filters` (see `where`)"""
+        where, params = self.where(**filters)
+        return self._stream(
+            "SELECT notes.uuid, notes.title, tasks.task FROM tasks "
+            f"JOIN notes ON notes.id = tasks.note_id WHERE {where} "
+            "ORDER BY notes.id, tasks.position",
+            params,
+            batch_size,
+        )
+
+    @staticmethod
+    def where(
+        trashed: Optional[bool] = None,
+        archived: Optional[bool] = None,
+        tag: Optional[str] = None,
+        modified_since: Optional[float] = None,
+    ) -> Tuple[str, List[Any]]:
+        """SQL condition on `notes` selecting trashed or not trashed notes, archived
+        or not archived notes (any when None), notes with `tag` or one of its
+        sub-tags, and notes modified after `modified_since` (a Bear date)"""
+        conditions = ["1"]
+        params: List[Any] = []
+        for column, flag in (("trashed", trashed), ("archived", archived)):
+            if flag is not None:
+                conditions.append(f"IFNULL(notes.{column}, 0) = ?")
+                params.append(int(flag))
+        if tag is not None:
+            conditions.append(
+                "notes.id IN (SELECT note_id FROM tags "
+                "WHERE tag = ? OR tag LIKE ? ESCAPE '\\')"
+            )
+            params.extend([tag, _escape_like(tag) + "/%"])
+        if modified_since is not None:
+            conditions.append("notes.modified > ?")
+            params.append(modified_since)
+        return " AND ".join(conditions), params
+
+    def _stream(self, query: str, params: List[Any], batch_size: int) -> Iterator[Any]:
+        cursor = self.conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def duplicate_titles(self) -> List[Tuple[str, int]]:
+        """Titles used by more than one note, with their count"""
+        return self.conn.execute(
+            "SELECT title, COUNT(*) FROM notes GROUP BY title "
+            "HAVING COUNT(*) > 1 ORDER BY MIN(id)"
+        ).fetchall()
+
+    def signatures(
+        self, version: str, compute: Callable[[str], bytes], **filters: Any
+    ) -> List[Tuple[str, str, bytes]]:
+        """Signatures of the notes matching `filters` (see `where`), as
+        (uuid, title, signature). Only notes without a cached signature are passed
+        to `compute`; all are recomputed when `version` changes."""
+        with self.conn:
+            if self._meta("signatures") != version:
+                self.conn.execute("DELETE FROM signatures")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('signatures', ?)", (version,)
+                )
+            missing = self._stream(
+                "SELECT notes.id, notes.text FROM notes LEFT JOIN signatures "
+                "ON signatures.note_id = notes.id WHERE signatures.note_id IS NULL",
+                [],
+                500,
+            )
+            self.conn.executemany(
+                "INSERT INTO signatures VALUES (?, ?)",
+                [(note_id, compute(text or "")) for note_id, text in missing],
+            )
+        where, params = self.where(**filters)
+        return self.conn.execute(
+            "SELECT notes.uuid, notes.title, signatures.signature FROM notes "
+            f"JOIN signatures ON signatures.note_id = notes.id WHERE {where} "
+            "ORDER BY notes.id",
+            params,
+        ).fetchall()
+
+    def tagged(self, tag: str) -> List[Tuple[str, str]]:
+        """Notes with `tag` (or one of its sub-tags), as (uuid, title)"""
+        where, params = self.where(tag=tag)
+        return self.conn.execute(
+            f"SELECT uuid, title FROM notes WHERE {where} ORDER BY id", params
+        ).fetchall()
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[str, str, str]]:
+        """Full-text search (FTS5 query syntax), best matches first,
+        as (uuid, title, snippet)"""
+        return self.conn.execute(
+            "SELECT notes.uuid, notes.title, "
+            "snippet(notes_fts, 1, '[', ']', '...', 12) FROM notes_fts "
+            "JOIN notes ON notes.id = notes_fts.rowid "
+            "WHERE notes_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        ).fetchall()
+
+    def close(self) -> None:
+        """Close the cache database"""
+        self.conn.close()
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -1,29 +1,62 @@
 # pylint: skip-file
 """Methods to sync a bear database with a markdown directory"""
 import sqlite3
+import collections
+import copy
 import datetime
 import re
 import subprocess
 import urllib.parse
+import urllib.request
 import os
 import time
 import shutil
-import fnmatch
 import json
 import coloredlogs  # type: ignore
 import logging
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List
 
+from libbear import tokens
+from libbear.assets import AssetStore
+from libbear.dispatch import XCallbackDispatcher, open_launcher
+from libbear.finder_tags import file_tags, file_tags_batch
+from libbear.journal import change_journal
+from libbear.manifest import ExportManifest, content_hash
+from libbear.metrics import SyncMetrics
+from libbear.mirror import excluded, mirror_all, mirror_tree
+
 # Create a logger object.
 logger = logging.getLogger("bear")
 coloredlogs.install(level="DEBUG")
 
+# BearSync used by the note rendering worker processes
+_renderer = None
+
+
+def note_title(md_text):
+    """Title Bear gives a note, its first line without heading marks"""
+    lines = md_text.strip().splitlines() or [""]
+    return re.sub(r"^#+ ", r"", lines[0]).strip()
+
+
+def _init_renderer(bear_sync):
+    """Set up a rendering worker process"""
+    global _renderer
+    _renderer = bear_sync
+
+
+def _render_batch(rows):
+    """Render a batch of notes in a worker process"""
+    return [_renderer.render_row(row) for row in rows]
+
 
 class BearSync:
     """Class to sync a bear db with a folder"""
 
-    def __init__(self):
+    def __init__(self, home=None, export_path=None, bear_db=None, bear_image_path=None):
+        """Paths default to Bear's macOS container and folders in `home` ($HOME)"""
         # Exports to folders using first tag only, if `multi_tag_folders = False`
         self.make_tag_folders = True
         self.multi_tag_folders = False  # Copies notes to all 'tag-paths' found in note!
@@ -61,12 +94,12 @@ class BearSync:
         # NOTE! Your user 'HOME' path and '/BearNotes' is added below!
         # NOTE! So do not change anything below here!!!
 
-        self.home = os.getenv("HOME", "")
+        self.home = home or os.getenv("HOME", "")
 
         self.set_logging_on = True
 
         # NOTE! if 'BearNotes' is left blank, all other files in my_sync_service will be deleted!!
-        self.export_path = os.path.join(self.home, "BearNotes")
+        self.export_path = export_path or os.path.join(self.home, "BearNotes")
         # NOTE! "export_path" is used for sync-back to Bear, so don't change this variable name!
         self.multi_export = [(self.export_path, True)]  # only one folder output here.
         # Use if you want export to severa places like: Dropbox and OneDrive, etc. See below
@@ -81,7 +114,7 @@ class BearSync:
         self.temp_path = os.path.join(
             self.home, "Temp", "BearExportTemp"
         )  # NOTE! Do not change the "BearExportTemp" folder name!!!
-        self.bear_db = os.path.join(
+        self.bear_db = bear_db or os.path.join(
             self.home,
             "Library/Group Containers/9K33E3U3T4.net.shinyfrog.bear"
             + "/Application Data/database.sqlite",
@@ -90,14 +123,30 @@ class BearSync:
             self.home, "BearSyncBackup"
         )  # Backup of original note before sync to Bear.
         self.log_file = os.path.join(self.sync_backup, "bear_export_sync_log.txt")
+        # Stage timings and counters of every sync, one JSON line per run.
+        # Set `profile_file` to also dump a cProfile of the slowest stage there.
+        self.metrics_file = os.path.join(self.sync_backup, "sync-metrics.jsonl")
+        self.profile_file = None
+        self.metrics = SyncMetrics()
+        # Report the exported files a sync would write or delete instead of
+        # changing anything, as ("write" | "delete", path) in `dry_run_changes`
+        self.dry_run = False
+        self.dry_run_changes = []
 
         # Paths used in image exports:
-        self.bear_image_path = os.path.join(
+        self.bear_image_path = bear_image_path or os.path.join(
             self.home,
             "Library/Group Containers/9K33E3U3T4.net.shinyfrog.bear/"
             + "Application Data/Local Files/Note Images",
         )
         self.assets_path = os.path.join(self.home, self.export_path, "BearImages")
+        # Only copy changed images referenced by notes and delete unreferenced ones,
+        # instead of mirroring all Bear images.
+        self.incremental_assets = True
+        self.asset_index_file = os.path.join(self.sync_backup, "asset-index.json")
+        self.assets = None
+        # Images of the notes written by the last export, None for all of them
+        self.pending_images = None
 
         self.sync_ts = ".sync-time.log"
         self.export_ts = ".export-time.log"
@@ -107,32 +156,238 @@ class BearSync:
         self.export_ts_file_exp = os.path.join(self.export_path, self.export_ts)
         self.export_ts_file = os.path.join(self.temp_path, self.export_ts)
 
-        self.gettag_sh = os.path.join(self.home, "temp/gettag.sh")
-        self.gettag_txt = os.path.join(self.home, "temp/gettag.txt")
+        # Full exports are mirrored from the temp folder to all `multi_export`
+        # folders at once, leaving entries matching `mirror_excludes` alone.
+        self.mirror_excludes = ["BearImages/", ".Ulysses*", "*.Ulysses_Public_Filter"]
+        self.mirror_workers = 4
+
+        # Only re-export notes whose ZMODIFICATIONDATE changed since the last export,
+        # writing them straight to `multi_export` instead of temp folder + mirror.
+        # A full export is still done when there is no (valid) manifest.
+        self.incremental_export = True
+        self.manifest_file = os.path.join(self.sync_backup, "export-manifest.json")
+
+        # Full exports read notes in batches of `export_batch_size`, render them in
+        # `render_workers` processes and write them with `write_workers` threads.
+        # Set both to 1 for a serial export.
+        self.render_workers = os.cpu_count() or 1
+        self.write_workers = 4
+        self.export_batch_size = 200
+
+        # Markdown updates are imported once no file changed for `sync_debounce`
+        # seconds, re-checking for new updates at most `sync_max_rounds` times.
+        self.sync_debounce = 5.0
+        self.sync_max_rounds = 10
+        # Updates are sent to Bear with `launcher` (`open` by default), waiting up to
+        # `bear_update_timeout` seconds for Bear to change the note in its database.
+        self.launcher = open_launcher
+        self.bear_update_timeout = 5.0
+        self.dispatcher = None
+        self.use_inotify = True  # Only on Linux, scans the export folder otherwise
+        self.journal = None
+        # Files written by the current export, not to be taken for Markdown updates
+        self.written_files = set()
+
+        # Kept open between syncs by long-running processes (`bear --watch`)
+        self.connection = None
+        self.manifest = None
+        # Notes fetched in one query for the markdown files being imported
+        self.note_cache = {}
+
+        # Finder tags of files being imported, by path
+        self.tag_cache = {}
+        # Markdown files and textbundles imported as new notes, removed from the
+        # export folder once Bear re-exports them under their tag path
+        self.imported_new_notes = set()
 
         self.code_blocks = re.compile(r"^`{3}([\S]+)?\n([\s\S]+)\n`{3}", re.IGNORECASE)
 
+    def __getstate__(self):
+        """Open handles stay in this process when pickled for the render workers"""
+        state = self.__dict__.copy()
+        state["connection"] = None
+        state["journal"] = None
+        state["manifest"] = None
+        state["assets"] = None
+        state["dispatcher"] = None
+        # Render workers never launch Bear, and custom launchers may not pickle
+        state["launcher"] = None
+        return state
+
     def sync(self):
         """Sync the folders"""
-        self.init_gettag_script()
+        self.sync_cycle()
+
+    def sync_cycle(self):
+        """Send markdown updates to Bear, then export Bear if it was modified.
+        Returns the number of notes exported, if any."""
+        if self.dry_run:
+            return self.dry_run_export()
+        note_count = None
+        self.metrics = SyncMetrics(profile=self.profile_file is not None)
         logger.debug("Syncing MD updates")
-        self.sync_md_updates()
+        with self.metrics.stage("sync_md_updates"):
+            self.sync_md_updates()
         if self.check_db_modified():
-            logger.debug("Deleting old temp files")
-            self.delete_old_temp_files()
-            logger.debug("Exporting files")
-            note_count = self.export_markdown()
-            logger.debug("Exported %s files", note_count)
-            self.write_time_stamp()
-            logger.debug("Syncing files from temp")
-            self.rsync_files_from_temp()
+            self.written_files = set()
+            manifest = self.load_manifest()
+            if self.incremental_export and manifest.valid:
+                logger.debug("Exporting changed files")
+                with self.metrics.stage("export"):
+                    note_count = self.export_incremental(manifest)
+                logger.debug("Exported %s files", note_count)
+                self.write_time_stamp()
+                self.copy_time_stamps()
+            else:
+                manifest.entries.clear()
+                logger.debug("Deleting old temp files")
+                self.delete_old_temp_files()
+                logger.debug("Exporting files")
+                with self.metrics.stage("export"):
+                    note_count = self.export_markdown(manifest)
+                logger.debug("Exported %s files", note_count)
+                self.write_time_stamp()
+                logger.debug("Syncing files from temp")
+                with self.metrics.stage("mirror"):
+                    self.rsync_files_from_temp()
+            manifest.save()
+            self.refresh_journal()
             if self.export_image_repository and not self.export_as_textbundles:
-                self.copy_bear_images()
+                with self.metrics.stage("images"):
+                    self.copy_bear_images(manifest)
+            elif self.assets is not None:
+                self.assets.save()
             # notify('Export completed')
             logger.debug("%s notes exported to: %s", note_count, self.export_path)
             self.write_log(str(note_count) + " notes exported to: " + self.export_path)
         else:
             logger.debug("No changes found")
+        self.emit_metrics()
+        return note_count
+
+    def refresh_journal(self):
+        """Record the exported files in the change journal, so the next sync does
+        not see them as changed"""
+        if self.journal is None:
+            return
+        paths = set()
+        for path in self.written_files:
+            # Full exports are written to the temp folder, then mirrored
+            if path.startswith(self.temp_path + os.sep):
+                path = os.path.join(
+                    self.export_path, os.path.relpath(path, self.temp_path)
+                )
+            paths.add(path)
+        self.journal.refresh(paths)
+        self.written_files = set()
+
+    def dry_run_export(self):
+        """Find the exported files a sync would write or delete, without changing
+        anything. Without a valid manifest, every note is compared but stale
+        files can't be found."""
+        self.dry_run_changes = []
+        manifest = copy.deepcopy(self.load_manifest())
+        if not manifest.valid:
+            manifest.entries.clear()
+        self.export_incremental(manifest)
+        return len(self.dry_run_changes)
+
+    def emit_metrics(self):
+        """Append the metrics of this run to `metrics_file`"""
+        if not os.path.exists(self.sync_backup):
+            os.makedirs(self.sync_backup)
+        line = self.metrics.emit(self.metrics_file, self.profile_file)
+        logger.debug("Sync metrics: %s", line)
+
+    def call(self, args):
+        """Run a command, counting it"""
+        self.metrics.count("subprocesses")
+        return subprocess.call(args)
+
+    def connect(self):
+        """Read-only connection to the Bear database"""
+        if self.connection is None:
+            uri = "file:" + urllib.request.pathname2url(self.bear_db) + "?mode=ro"
+            self.connection = sqlite3.connect(uri, uri=True)
+            self.connection.row_factory = sqlite3.Row
+        return self.connection
+
+    def get_notes(self, uuids):
+        """Get notes by UUID, in as few queries as possible"""
+        uuids = list(uuids)
+        notes = {}
+        conn = self.connect()
+        # One read transaction, so all notes come from the same snapshot
+        snapshot = not conn.in_transaction
+        if snapshot:
+            conn.execute("BEGIN")
+        try:
+            for start in range(0, len(uuids), 500):
+                chunk = uuids[start : start + 500]
+                query = (
+                    "SELECT `ZUNIQUEIDENTIFIER`, `ZTITLE`, `ZTEXT`, `ZMODIFICATIONDATE`, "
+                    + "`ZTRASHED` FROM `ZSFNOTE` WHERE `ZUNIQUEIDENTIFIER` IN ("
+                    + ",".join("?" * len(chunk))
+                    + ")"
+                )
+                for row in conn.execute(query, chunk):
+                    notes[row["ZUNIQUEIDENTIFIER"]] = row
+        finally:
+            if snapshot:
+                conn.execute("COMMIT")
+        self.metrics.count("notes_read", len(notes))
+        return notes
+
+    def modification_dates(self, uuids):
+        """Modification dates of notes by UUID, polled while waiting for Bear, so
+        neither reading the notes' text nor counting them as read"""
+        uuids = list(uuids)
+        dates = {}
+        for start in range(0, len(uuids), 500):
+            chunk = uuids[start : start + 500]
+            query = (
+                "SELECT `ZUNIQUEIDENTIFIER`, `ZMODIFICATIONDATE` FROM `ZSFNOTE` "
+                + "WHERE `ZUNIQUEIDENTIFIER` IN ("
+                + ",".join("?" * len(chunk))
+                + ")"
+            )
+            dates.update(self.connect().execute(query, chunk).fetchall())
+        return dates
+
+    def latest_modification(self):
+        """Modification date of the most recently modified note"""
+        query = "SELECT MAX(`ZMODIFICATIONDATE`) FROM `ZSFNOTE`"
+        return self.connect().execute(query).fetchone()[0] or 0.0
+
+    def notes_titled(self, title, since):
+        """UUIDs of the notes with this title modified after `since`"""
+        query = (
+            "SELECT `ZUNIQUEIDENTIFIER` FROM `ZSFNOTE` "
+            + "WHERE `ZTITLE` = ? AND `ZMODIFICATIONDATE` > ?"
+        )
+        return [row[0] for row in self.connect().execute(query, (title, since))]
+
+    def x_callback_dispatcher(self):
+        """Queue of updates for Bear"""
+        if self.dispatcher is None:
+            self.dispatcher = XCallbackDispatcher(
+                self.modification_dates,
+                self.latest_modification,
+                self.notes_titled,
+                launcher=self.launcher,
+                timeout=self.bear_update_timeout,
+            )
+        return self.dispatcher
+
+    def get_note(self, uuid):
+        """Get a single note by UUID, from the prefetched notes if possible"""
+        if uuid in self.note_cache:
+            return self.note_cache[uuid]
+        query = (
+            "SELECT `ZUNIQUEIDENTIFIER`, `ZTITLE`, `ZTEXT`, `ZMODIFICATIONDATE`, "
+            + "`ZTRASHED` FROM `ZSFNOTE` WHERE `ZUNIQUEIDENTIFIER` = ?"
+        )
+        return self.connect().execute(query, (uuid,)).fetchone()
 
     def write_log(self, message):
         """Write to log"""
@@ -148,52 +403,318 @@ class BearSync:
         """Check if the DB was modified"""
         if not os.path.exists(self.sync_ts_file):
             return True
-        db_ts = self.get_file_date(self.bear_db)
+        # Recent changes may only be in the write-ahead log
+        db_ts = max(
+            self.get_file_date(self.bear_db), self.get_file_date(self.bear_db + "-wal")
+        )
         last_export_ts = self.get_file_date(self.export_ts_file_exp)
         return db_ts > last_export_ts
 
-    def export_markdown(self):
+    def export_markdown(self, manifest=None):
         """Export markdown"""
-        with sqlite3.connect(self.bear_db) as conn:
-            conn.row_factory = sqlite3.Row
-            query = "SELECT * FROM `ZSFNOTE` WHERE `ZTRASHED` LIKE '0'"
-            cursor = conn.execute(query)
+        if self.render_workers > 1 or self.write_workers > 1:
+            return self.export_markdown_parallel(manifest)
+        query = "SELECT * FROM `ZSFNOTE` WHERE `ZTRASHED` LIKE '0'"
+        cursor = self.connect().execute(query)
         note_count = 0
+        self.pending_images = None
         for row in cursor:
-            title = row["ZTITLE"]
-            md_text = row["ZTEXT"].rstrip()
-            # creation_date = row["ZCREATIONDATE"]
-            modified = row["ZMODIFICATIONDATE"]
+            self.metrics.count("notes_read")
+            uuid, modified, digest, paths, outputs, images = self.render_row(row)
+            for (filepath, text, mod_dt, bundle) in outputs:
+                note_count += 1
+                self.write_output(text, filepath, mod_dt, bundle)
+            if manifest is not None:
+                manifest.set(uuid, modified, digest, paths, images)
+        return note_count
+
+    def export_markdown_parallel(self, manifest=None):
+        """Export markdown through a reader -> renderer processes -> writer threads pipeline"""
+        query = (
+            "SELECT `ZUNIQUEIDENTIFIER`, `ZTITLE`, `ZTEXT`, `ZMODIFICATIONDATE` "
+            + "FROM `ZSFNOTE` WHERE `ZTRASHED` LIKE '0'"
+        )
+        note_count = 0
+        writes = {}
+        self.pending_images = None
+        if self.export_as_textbundles and not self.dry_run:
+            # Load the image repository before the writer threads place images in it
+            self.asset_store()
+        cursor = self.connect().execute(query)
+        with ProcessPoolExecutor(
+            max_workers=self.render_workers,
+            initializer=_init_renderer,
+            initargs=(self,),
+        ) as renderers, ThreadPoolExecutor(max_workers=self.write_workers) as writers:
+            rendering = collections.deque()
+            batches = iter(lambda: cursor.fetchmany(self.export_batch_size), [])
+            for batch in batches:
+                rows = [dict(row) for row in batch]
+                self.metrics.count("notes_read", len(rows))
+                rendering.append(renderers.submit(_render_batch, rows))
+                # Keep a bounded number of batches in flight
+                if len(rendering) > 2 * self.render_workers:
+                    results = rendering.popleft().result()
+                    note_count += self.queue_writes(results, writers, writes, manifest)
+            while rendering:
+                results = rendering.popleft().result()
+                note_count += self.queue_writes(results, writers, writes, manifest)
+        for future in writes.values():
+            future.result()
+        return note_count
+
+    def queue_writes(self, results, writers, writes, manifest):
+        """Hand rendered notes to the writer threads, in order for each path"""
+        note_count = 0
+        for uuid, modified, digest, paths, outputs, images in results:
+            for (filepath, text, mod_dt, bundle) in outputs:
+                # Notes with the same title share a path; the last one must win
+                previous = writes.get(filepath)
+                if previous is not None:
+                    previous.result()
+                writes[filepath] = writers.submit(
+                    self.write_output, text, filepath, mod_dt, bundle
+                )
+                note_count += 1
+            if manifest is not None:
+                manifest.set(uuid, modified, digest, paths, images)
+        return note_count
+
+    def export_incremental(self, manifest):
+        """Export only the notes added, modified or trashed since the last export"""
+        conn = self.connect()
+        query = (
+            "SELECT `ZUNIQUEIDENTIFIER`, `ZMODIFICATIONDATE` FROM `ZSFNOTE` "
+            + "WHERE `ZTRASHED` LIKE '0'"
+        )
+        notes = {row[0]: row[1] for row in conn.execute(query)}
+        missing = self.missing_exports(manifest)
+        changed = set(manifest.changed(notes)) | (missing & set(notes))
+        rows = list(self.get_notes(changed).values())
+        new_notes = [uuid for uuid in changed if manifest.get(uuid) is None]
+        note_count = 0
+        stale_paths = []
+        self.pending_images = set()
+        for row in rows:
             uuid = row["ZUNIQUEIDENTIFIER"]
-            filename = self.clean_title(title)  # + date_time_conv(creation_date)
-            file_list = []
-            if self.make_tag_folders:
-                file_list = self.sub_path_from_tag(self.temp_path, filename, md_text)
-            else:
-                file_list.append(os.path.join(self.temp_path, filename))
-            if file_list:
+            modified = row["ZMODIFICATIONDATE"]
+            file_list, md_text = self.render_note(row)
+            digest = content_hash(md_text)
+            paths = self.relative_note_paths(file_list, md_text)
+            images = tokens.IMAGE.findall(md_text) if file_list else []
+            entry = manifest.get(uuid)
+            if (
+                entry is None
+                or entry.digest != digest
+                or entry.paths != paths
+                or uuid in missing
+            ):
                 mod_dt = self.dt_conv(modified)
-                md_text = self.hide_tags(md_text)
-                md_text += "\n\n<!-- {BearID:" + uuid + "} -->\n"
-                for filepath in file_list:
-                    note_count += 1
-                    # print(filepath)
-                    if self.export_as_textbundles:
-                        if self.check_image_hybrid(md_text):
-                            self.make_text_bundle(md_text, filepath, mod_dt)
-                        else:
-                            self.write_file(filepath + ".md", md_text, mod_dt)
-                    elif self.export_image_repository:
-                        md_proc_text = self.process_image_links(md_text, filepath)
-                        self.write_file(filepath + ".md", md_proc_text, mod_dt)
-                    else:
-                        self.write_file(filepath + ".md", md_text, mod_dt)
+                for (dest_path, _) in self.multi_export:
+                    for filepath in file_list:
+                        target = os.path.join(
+                            dest_path, os.path.relpath(filepath, self.temp_path)
+                        )
+                        self.write_note(md_text, target, mod_dt, dest_path)
+                note_count += len(file_list)
+                self.pending_images.update(images)
+                if entry is not None:
+                    stale_paths.extend(p for p in entry.paths if p not in paths)
+            manifest.set(uuid, modified, digest, paths, images)
+        for uuid in manifest.removed(notes):
+            stale_paths.extend(manifest.get(uuid).paths)
+            manifest.remove(uuid)
+        # Notes with the same title share a path, so only delete unclaimed ones
+        claimed = {path for entry in manifest.entries.values() for path in entry.paths}
+        stale_paths = [path for path in stale_paths if path not in claimed]
+        added = [path for uuid in new_notes for path in manifest.get(uuid).paths]
+        self.remove_imported_sources(added, claimed)
+        unknown = 0
+        for (dest_path, delete) in self.multi_export:
+            if delete:
+                self.remove_exported(stale_paths, dest_path)
+                # Files written or deleted outside Bear, as the mirror did
+                unknown_paths = self.unknown_exports(dest_path, claimed)
+                self.remove_exported(unknown_paths, dest_path)
+                unknown += len(unknown_paths)
+        logger.debug(
+            "%s notes changed, %s stale and %s unknown files removed",
+            len(rows),
+            len(stale_paths),
+            unknown,
+        )
         return note_count
 
+    def missing_exports(self, manifest):
+        """UUIDs of exported notes with a file missing from a `delete` export folder"""
+        missing = set()
+        for (dest_path, delete) in self.multi_export:
+            if not delete:
+                continue
+            for uuid, entry in manifest.entries.items():
+                for path in entry.paths:
+                    if not os.path.exists(os.path.join(dest_path, path)):
+                        missing.add(uuid)
+                        break
+        return missing
+
+    def unknown_exports(self, root, claimed):
+        """Paths in an export folder that no exported note claims. Excluded
+        entries, time stamps and files changed since Markdown updates were last
+        checked (so not imported yet) are kept."""
+        if not os.path.exists(self.sync_ts_file):
+            return []
+        checked = os.path.getmtime(self.sync_ts_file)
+        unknown = []
+        for folder, folders, files in os.walk(root):
+            relative = os.path.relpath(folder, root)
+            prefix = "" if relative == "." else relative + os.sep
+            entries = [(name, True) for name in folders if name.endswith(".textbundle")]
+            entries += [(name, False) for name in files]
+            # Textbundles are checked as a whole, excluded folders are left alone
+            folders[:] = [
+                name
+                for name in folders
+                if not name.endswith(".textbundle")
+                and not excluded(name, True, self.mirror_excludes)
+            ]
+            for name, is_dir in entries:
+                path = prefix + name
+                target = os.path.join(folder, name)
+                if (
+                    path in claimed
+                    or path in (self.sync_ts, self.export_ts)
+                    or target in self.imported_new_notes
+                    or excluded(name, is_dir, self.mirror_excludes)
+                    or os.path.getmtime(target) > checked
+                ):
+                    continue
+                unknown.append(path)
+        return unknown
+
+    def remove_imported_sources(self, added, claimed):
+        """Delete the files imported as new notes that Bear exported again, under
+        their tag path, as notes `added` to the manifest"""
+        exported = {os.path.splitext(os.path.basename(path))[0] for path in added}
+        for source in sorted(self.imported_new_notes):
+            path = os.path.relpath(source, self.export_path)
+            name = os.path.splitext(os.path.basename(source))[0]
+            if not os.path.exists(source):
+                self.imported_new_notes.discard(source)
+            elif name in exported and path not in claimed:
+                logger.debug("Removing imported %s", source)
+                self.remove_exported([path], self.export_path)
+                if not self.dry_run:
+                    self.imported_new_notes.discard(source)
+
+    def render_row(self, row):
+        """Render a note row into its manifest data and the outputs to write"""
+        uuid = row["ZUNIQUEIDENTIFIER"]
+        modified = row["ZMODIFICATIONDATE"]
+        file_list, md_text = self.render_note(row)
+        mod_dt = self.dt_conv(modified)
+        outputs = []
+        for filepath in file_list:
+            text, bundle = self.render_output(md_text, filepath)
+            outputs.append((filepath, text, mod_dt, bundle))
+        paths = self.relative_note_paths(file_list, md_text)
+        images = tokens.IMAGE.findall(md_text) if file_list else []
+        return uuid, modified, content_hash(md_text), paths, outputs, images
+
+    def render_note(self, row):
+        """Get the export paths (without extension) and text of a note"""
+        title = row["ZTITLE"]
+        md_text = row["ZTEXT"].rstrip()
+        # creation_date = row["ZCREATIONDATE"]
+        uuid = row["ZUNIQUEIDENTIFIER"]
+        filename = self.clean_title(title)  # + date_time_conv(creation_date)
+        file_list = []
+        if self.make_tag_folders:
+            file_list = self.sub_path_from_tag(self.temp_path, filename, md_text)
+        else:
+            file_list.append(os.path.join(self.temp_path, filename))
+        if file_list:
+            md_text = self.hide_tags(md_text)
+            md_text += "\n\n<!-- {BearID:" + uuid + "} -->\n"
+        return file_list, md_text
+
+    def note_extension(self, md_text):
+        """Extension a note is exported with"""
+        if self.export_as_textbundles and self.check_image_hybrid(md_text):
+            return ".textbundle"
+        return ".md"
+
+    def relative_note_paths(self, file_list, md_text):
+        """Exported paths of a note, relative to the export folder"""
+        extension = self.note_extension(md_text)
+        return [
+            os.path.relpath(filepath, self.temp_path) + extension
+            for filepath in file_list
+        ]
+
+    def render_output(self, md_text, filepath, root=None):
+        """Final text of a note exported to `filepath` and whether it is a textbundle"""
+        if self.export_as_textbundles:
+            return md_text, self.check_image_hybrid(md_text)
+        if self.export_image_repository:
+            return self.process_image_links(md_text, filepath, root), False
+        return md_text, False
+
+    def write_output(self, text, filepath, mod_dt, bundle):
+        """Write a rendered note to `filepath` (without extension)"""
+        self.metrics.count("notes_written")
+        if bundle:
+            self.make_text_bundle(text, filepath, mod_dt)
+        else:
+            self.write_file(filepath + ".md", text, mod_dt)
+
+    def write_note(self, md_text, filepath, mod_dt, root=None):
+        """Write a note to `filepath` (without extension) inside `root`"""
+        text, bundle = self.render_output(md_text, filepath, root)
+        self.write_output(text, filepath, mod_dt, bundle)
+
+    def remove_exported(self, paths, root):
+        """Delete exported notes and any tag folders left empty"""
+        for path in paths:
+            target = os.path.join(root, path)
+            if self.dry_run:
+                if os.path.exists(target):
+                    self.dry_run_changes.append(("delete", target))
+                continue
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            parent = os.path.dirname(target)
+            while parent.startswith(root + os.sep) and os.path.isdir(parent):
+                if os.listdir(parent):
+                    break
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+
+    def load_manifest(self):
+        """Load the export manifest for the current export settings"""
+        settings = [
+            self.make_tag_folders,
+            self.multi_tag_folders,
+            self.hide_tags_in_comment_block,
+            self.only_export_these_tags,
+            self.no_export_tags,
+            self.export_as_textbundles,
+            self.export_as_hybrids,
+            self.export_image_repository,
+            self.multi_export,
+        ]
+        fingerprint = content_hash(json.dumps(settings))
+        if self.manifest is None or self.manifest.fingerprint != fingerprint:
+            self.manifest = ExportManifest(self.manifest_file, fingerprint)
+            self.manifest.load()
+        return self.manifest
+
     def check_image_hybrid(self, md_text):
         """Check image hybrid"""
         if self.export_as_hybrids:
-            return bool(re.search(r"\[image:(.+?)\]", md_text))
+            return tokens.has_images(md_text)
         else:
             return True
 
@@ -203,7 +724,7 @@ class BearSync:
         """
         bundle_path = filepath + ".textbundle"
         assets_path = os.path.join(bundle_path, "assets")
-        if not os.path.exists(bundle_path):
+        if not os.path.exists(bundle_path) and not self.dry_run:
             os.makedirs(bundle_path)
             os.makedirs(assets_path)
 
@@ -213,55 +734,36 @@ class BearSync:
         "creatorIdentifier" : "net.shinyfrog.bear",
         "version" : 2
         }"""
-        matches = re.findall(r"\[image:(.+?)\]", md_text)
-        for match in matches:
+        for match in tokens.IMAGE.findall(md_text):
             image_name = match
             new_name = image_name.replace("/", "_")
             source = os.path.join(self.bear_image_path, image_name)
-            target = os.path.join(self.assets_path, new_name)
-            shutil.copy2(source, target)
+            if not self.dry_run:
+                self.asset_store().place(source, new_name)
 
-        md_text = re.sub(r"\[image:(.+?)/(.+?)\]", r"![](assets/\1_\2)", md_text)
+        md_text = tokens.IMAGE_PARTS.sub(r"![](assets/\1_\2)", md_text)
         self.write_file(bundle_path + "/text.md", md_text, mod_dt)
         self.write_file(bundle_path + "/info.json", info, mod_dt)
-        os.utime(bundle_path, (-1, mod_dt))
+        if not self.dry_run:
+            os.utime(bundle_path, (-1, mod_dt))
 
     def sub_path_from_tag(self, temp_path, filename, md_text):
         """Extract sub path from tag"""
         # md_text = code_blocks.sub("", md_text)
         # Get tags in note:
-        logger.debug(temp_path)
-        pattern1 = r"(?<!\S)\#([.\w\/\-]+)[ \n]?(?!([\/ \w]+\w[#]))"
-        pattern2 = r"(?<![\S])\#([^ \d][.\w\/ ]+?)\#([ \n]|$)"
+        note_tokens = tokens.tokenize(md_text)
         if self.multi_tag_folders:
             # Files copied to all tag-folders found in note
-            tags = []
-            for matches in re.findall(pattern1, md_text):
-                tag = matches[0]
-                tags.append(tag)
-            for matches2 in re.findall(pattern2, md_text):
-                tag2 = matches2[0]
-                tags.append(tag2)
+            tags = note_tokens.hash_tags + note_tokens.closed_tags
             if len(tags) == 0:
                 # No tags found, copy to root level only
                 return [os.path.join(self.temp_path, filename)]
         else:
             # Only folder for first tag
-            match1 = re.search(pattern1, md_text)
-            match2 = re.search(pattern2, md_text)
-            if match1 and match2:
-                if match1.start(1) < match2.start(1):
-                    tag = match1.group(1)
-                else:
-                    tag = match2.group(1)
-            elif match1:
-                tag = match1.group(1)
-            elif match2:
-                tag = match2.group(1)
-            else:
+            if note_tokens.first_tag is None:
                 # No tags found, copy to root level only
                 return [os.path.join(self.temp_path, filename)]
-            tags = [tag]
+            tags = [note_tokens.first_tag]
         paths = []
         for tag in tags:
             if tag == "/":
@@ -283,21 +785,17 @@ class BearSync:
             else:
                 sub_path = tag
             tag_path = os.path.join(self.temp_path, sub_path)
-            if not os.path.exists(tag_path):
-                os.makedirs(tag_path)
             paths.append(os.path.join(tag_path, filename))
         return paths
 
-    def process_image_links(self, md_text, filepath):
+    def process_image_links(self, md_text, filepath, root=None):
         """
         Bear image links converted to MD links
         """
-        root = filepath.replace(self.temp_path, "")
+        root = filepath.replace(root or self.temp_path, "")
         level = len(root.split("/")) - 2
         parent = "../" * level
-        md_text = re.sub(
-            r"\[image:(.+?)\]", r"![](" + parent + r"BearImages/\1)", md_text
-        )
+        md_text = tokens.IMAGE.sub(r"![](" + parent + r"BearImages/\1)", md_text)
         return md_text
 
     def restore_image_links(self, md_text):
@@ -323,21 +821,38 @@ class BearSync:
             print(md_text)
         return md_text
 
-    def copy_bear_images(self):
+    def asset_store(self):
+        """Exported image repository. Not thread-safe until loaded, so
+        `export_markdown_parallel` loads it before starting its writers."""
+        if self.assets is None:
+            self.assets = AssetStore(self.assets_path, self.asset_index_file)
+            self.assets.load()
+        return self.assets
+
+    def copy_bear_images(self, manifest=None):
         """Image files copied to a common image repository"""
-        subprocess.call(
-            [
-                "rsync",
-                "-r",
-                "-t",
-                "--delete",
-                self.bear_image_path + "/",
-                self.assets_path,
-            ]
-        )
+        if self.incremental_assets and manifest is not None:
+            store = self.asset_store()
+            referenced = manifest.referenced_images()
+            if self.pending_images is None:
+                names = referenced
+            else:
+                names = self.pending_images & referenced
+            copied = store.sync(self.bear_image_path, sorted(names))
+            removed = store.collect(referenced)
+            store.save()
+            self.metrics.count("images_copied", copied)
+            self.metrics.count("images_removed", removed)
+            logger.debug("%s images copied, %s images removed", copied, removed)
+            return
+        stats = mirror_tree(self.bear_image_path, self.assets_path, delete=True)
+        self.count_mirror(stats)
+        logger.debug("%s images copied, %s images removed", stats.copied, stats.deleted)
 
     def write_time_stamp(self):
         """write to time-stamp.txt file (used during sync)"""
+        if not os.path.exists(self.temp_path):
+            os.makedirs(self.temp_path)
         self.write_file(
             self.export_ts_file,
             "Markdown from Bear written at: "
@@ -351,21 +866,21 @@ class BearSync:
             0,
         )
 
+    def copy_time_stamps(self):
+        """Copy the time-stamp files to the export folders (done by the mirror otherwise)"""
+        for (dest_path, delete) in self.multi_export:
+            if not os.path.exists(dest_path):
+                os.makedirs(dest_path)
+            shutil.copy2(self.export_ts_file, dest_path)
+            shutil.copy2(self.sync_ts_file_temp, dest_path)
+
     def hide_tags(self, md_text):
         """Hide tags from being seen as H1, by placing `period+space` at start of line"""
-        if self.hide_tags_in_comment_block:
-            md_text = re.sub(r"(\n)[ \t]*(\#[\w.].+)", r"\1<!-- \2 -->", md_text)
-        else:
-            md_text = re.sub(r"(\n)[ \t]*(\#[\w.]+)", r"\1. \2", md_text)
-        return md_text
+        return tokens.hide_tags(md_text, self.hide_tags_in_comment_block)
 
     def restore_tags(self, md_text):
         """Tags back to normal Bear tags, stripping the `period+space` at start of line"""
-        # if hide_tags_in_comment_block:
-        md_text = re.sub(r"(\n)<!--[ \t]*(\#[\w.].+?) -->", r"\1\2", md_text)
-        # else:
-        md_text = re.sub(r"(\n)\.[ \t]*(\#[\w.]+)", r"\1\2", md_text)
-        return md_text
+        return tokens.restore_tags(md_text)
 
     def clean_title(self, title):
         """Clean title"""
@@ -377,11 +892,41 @@ class BearSync:
         return title.strip()
 
     def write_file(self, filename, file_content, modified):
-        """Write file"""
-        with open(filename, "w", encoding="utf-8") as f:
-            f.write(file_content)
+        """Write file, atomically and only if its content changed.
+        Files written with `modified` 0 get the current time, so are always written.
+        Returns whether the file was (or, in a dry run, would be) written."""
+        data = file_content.encode("utf-8")
+        if modified > 0 and self.same_content(filename, data):
+            self.metrics.count("writes_skipped")
+            if not self.dry_run and abs(os.path.getmtime(filename) - modified) > 1e-3:
+                os.utime(filename, (-1, modified))
+                self.written_files.add(filename)
+            return False
+        if self.dry_run:
+            self.dry_run_changes.append(("write", filename))
+            return True
+        folder, name = os.path.split(filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp = os.path.join(folder, "." + name + ".tmp")
+        with open(temp, "wb") as f:
+            f.write(data)
         if modified > 0:
-            os.utime(filename, (-1, modified))
+            os.utime(temp, (-1, modified))
+        os.replace(temp, filename)
+        self.written_files.add(filename)
+        self.metrics.count("bytes_written", len(data))
+        return True
+
+    def same_content(self, filename, data):
+        """Does the file exist with exactly this content (checking the size first)"""
+        try:
+            if os.path.getsize(filename) != len(data):
+                return False
+            with open(filename, "rb") as f:
+                return f.read() == data
+        except OSError:
+            return False
 
     def read_file(self, file_name):
         """Read file"""
@@ -434,37 +979,31 @@ class BearSync:
         os.makedirs(self.temp_path)
 
     def rsync_files_from_temp(self):
-        """Rsync"""
-        # Moves markdown files to new folder using rsync:
+        """Mirror the temp folder to all export folders"""
         # This is a very important step!
         # By first exporting all Bear notes to an emptied temp folder,
-        # rsync will only update destination if modified or size have changed.
+        # the mirror only updates destinations if size or modification time changed.
         # So only changed notes will be synced by Dropbox or OneDrive destinations.
-        # Rsync will also delete notes on destination if deleted in Bear.
-        # So doing it this way saves a lot of otherwise very complex programing.
-        # Thank you very much, Rsync! ;)
-        for (dest_path, delete) in self.multi_export:
-            if not os.path.exists(dest_path):
-                os.makedirs(dest_path)
-            if delete:
-                subprocess.call(
-                    [
-                        "rsync",
-                        "-r",
-                        "-t",
-                        "--delete",
-                        "--exclude",
-                        "BearImages/",
-                        "--exclude",
-                        ".Ulysses*",
-                        "--exclude",
-                        "*.Ulysses_Public_Filter",
-                        self.temp_path + "/",
-                        dest_path,
-                    ]
-                )
-            else:
-                subprocess.call(["rsync", "-r", "-t", self.temp_path + "/", dest_path])
+        # It also deletes notes on destinations with the delete flag if deleted in Bear.
+        results = mirror_all(
+            self.temp_path, self.multi_export, self.mirror_excludes, self.mirror_workers
+        )
+        for dest_path, stats in results.items():
+            self.count_mirror(stats)
+            logger.debug(
+                "%s files (%s bytes) copied, %s deleted in %s",
+                stats.copied,
+                stats.bytes_copied,
+                stats.deleted,
+                dest_path,
+            )
+
+    def count_mirror(self, stats):
+        """Add mirrored files to the metrics. `files_deleted` counts removed
+        entries, a removed folder once and not the files in it."""
+        self.metrics.count("files_mirrored", stats.copied)
+        self.metrics.count("files_deleted", stats.deleted)
+        self.metrics.count("bytes_mirrored", stats.bytes_copied)
 
     def sync_md_updates(self):
         """Sync md updates"""
@@ -475,41 +1014,76 @@ class BearSync:
             return False
         ts_last_sync = os.path.getmtime(self.sync_ts_file)
         ts_last_export = os.path.getmtime(self.export_ts_file)
-        # Update synced timestamp file:
-        self.update_sync_time_file(0)
-        file_types = ("*.md", "*.txt", "*.markdown")
-        for (root, dirnames, filenames) in os.walk(self.export_path):
-            logger.debug(dirnames)
-            for pattern in file_types:
-                for filename in fnmatch.filter(filenames, pattern):
-                    md_file = os.path.join(root, filename)
-                    timestamp = os.path.getmtime(md_file)
-                    if timestamp > ts_last_sync:
-                        if not updates_found:  # Yet
-                            # Wait 5 sec at first for external files to finish
-                            # downloading from dropbox.
-                            # Otherwise images in textbundles might be missing in import:
-                            time.sleep(5)
-                        updates_found = True
-                        md_text = self.read_file(md_file)
-                        self.backup_ext_note(md_file)
-                        if self.check_if_image_added(md_text, md_file):
-                            self.textbundle_to_bear(md_text, md_file, timestamp)
-                            self.write_log("Imported to Bear: " + md_file)
-                        else:
-                            self.update_bear_note(
-                                md_text, md_file, timestamp, ts_last_export
-                            )
-                            self.write_log("Bear Note Updated: " + md_file)
-        if updates_found:
-            # Give Bear time to process updates:
-            time.sleep(3)
+        journal = self.change_journal()
+        for _ in range(self.sync_max_rounds):
+            # Update synced timestamp file:
+            round_start = time.time()
+            self.update_sync_time_file(0)
+            changed = journal.changes(ts_last_sync)
+            if not changed:
+                break
+            # Wait for external files to finish downloading from dropbox.
+            # Otherwise images in textbundles might be missing in import:
+            waiting = time.perf_counter()
+            changed |= journal.wait_quiet(ts_last_sync, self.sync_debounce)
+            self.metrics.count("sleep_time", time.perf_counter() - waiting)
+            updates_found = True
+            md_files = [
+                md_file for md_file in sorted(changed) if os.path.exists(md_file)
+            ]
+            md_texts = [self.read_file(md_file) for md_file in md_files]
+            uuids = [match.group(1) for match in map(self.bear_id, md_texts) if match]
+            self.note_cache = self.get_notes(uuids)
+            bundles = [os.path.dirname(md_file) for md_file in md_files]
+            self.tag_cache = file_tags_batch(
+                md_files + [path for path in bundles if path.endswith(".textbundle")]
+            )
+            for md_file, md_text in zip(md_files, md_texts):
+                self.import_md_file(md_file, ts_last_export, md_text)
+            self.note_cache = {}
+            self.tag_cache = {}
+            # Wait for Bear to process the updates
+            stats = self.x_callback_dispatcher().flush()
+            self.metrics.count("sleep_time", stats.slept)
+            self.metrics.count("bear_updates", stats.sent)
+            self.metrics.count("bear_update_timeouts", stats.timed_out)
+            if self.launcher is open_launcher:
+                self.metrics.count("subprocesses", stats.sent)
+            journal.refresh(changed)
             # Check again, just in case new updates synced from remote (OneDrive/Dropbox)
             # during this process!
-            # The logic is not 100% fool proof, but should be close to 99.99%
-            self.sync_md_updates()  # Recursive call
+            ts_last_sync = round_start
+        else:
+            logger.warning(
+                "Markdown files still changing after %s rounds", self.sync_max_rounds
+            )
         return updates_found
 
+    def change_journal(self):
+        """Journal of changed files in the export folder, kept between calls"""
+        if self.journal is None:
+            self.journal = change_journal(
+                self.export_path, use_inotify=self.use_inotify
+            )
+        return self.journal
+
+    def import_md_file(self, md_file, ts_last_export, md_text=None):
+        """Send an updated markdown file or textbundle to Bear"""
+        timestamp = os.path.getmtime(md_file)
+        if md_text is None:
+            md_text = self.read_file(md_file)
+        self.backup_ext_note(md_file)
+        if self.check_if_image_added(md_text, md_file):
+            self.textbundle_to_bear(md_text, md_file, timestamp)
+            self.write_log("Imported to Bear: " + md_file)
+        else:
+            self.update_bear_note(md_text, md_file, timestamp, ts_last_export)
+            self.write_log("Bear Note Updated: " + md_file)
+
+    def bear_id(self, md_text):
+        """Match of the Bear note ID in an exported note"""
+        return re.search(r"\{BearID:(.+?)\}", md_text)
+
     def check_if_image_added(self, md_text, md_file):
         """Check if image added"""
         logger.debug(md_file)
@@ -542,10 +1116,13 @@ class BearSync:
         else:
             # New textbundle (with images), add path as tag:
             md_text = self.get_tag_from_path(md_text, bundle, self.export_path)
+            self.imported_new_notes.add(bundle)
         self.write_file(md_file, md_text, mod_dt)
         os.utime(bundle, (-1, mod_dt))
-        subprocess.call(["open", "-a", "/applications/bear.app", bundle])
-        time.sleep(0.5)
+        # Imported as a new note
+        self.x_callback_dispatcher().submit(
+            ["-a", "/applications/bear.app", bundle], title=note_title(md_text)
+        )
 
     def backup_ext_note(self, md_file):
         """Backup external note"""
@@ -618,6 +1195,7 @@ class BearSync:
             # New external md Note, since no Bear uuid found in text:
             # message = '::New external Note - ' + time_stamp_ts(ts) + '::'
             md_text = self.get_tag_from_path(md_text, md_file, self.export_path)
+            self.imported_new_notes.add(md_file)
             x_create = "bear://x-callback-url/create?show_window=no"
             self.bear_x_callback(x_create, md_text, "", "")
         return
@@ -654,14 +1232,10 @@ class BearSync:
         return md_text.strip() + "\n\n" + " ".join(tags) + "\n"
 
     def get_file_tags(self, md_file):
-        """Get file tags"""
-        try:
-            subprocess.call([self.gettag_sh, md_file, self.gettag_txt])
-            text = re.sub(r"\\n\d{1,2}", r"", self.read_file(self.gettag_txt))
-            tag_list = json.loads(text)
-            return tag_list
-        except OSError:
-            return []
+        """Get file tags, from the prefetched tags if possible"""
+        if md_file in self.tag_cache:
+            return self.tag_cache[md_file]
+        return file_tags(md_file)
 
     def bear_x_callback(self, x_command, md_text, message, orig_title):
         """Bear x-callback"""
@@ -677,37 +1251,27 @@ class BearSync:
             else:
                 md_text = "\n".join(lines[1:])
         x_command_text = x_command + "&text=" + urllib.parse.quote(md_text)
-        subprocess.call(["open", x_command_text])
-        time.sleep(0.2)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(x_command).query)
+        uuid = query["id"][0] if "id" in query else None
+        self.x_callback_dispatcher().submit(
+            [x_command_text], uuid, title=note_title(md_text)
+        )
 
     def check_sync_conflict(self, uuid, ts_last_export):
         """Check modified date of original note in Bear sqlite db!"""
         conflict = False
-        with sqlite3.connect(self.bear_db) as conn:
-            conn.row_factory = sqlite3.Row
-            query = (
-                "SELECT * FROM `ZSFNOTE` WHERE `ZTRASHED` LIKE '0' AND `ZUNIQUEIDENTIFIER` LIKE '"
-                + uuid
-                + "'"
-            )
-            c = conn.execute(query)
-        for row in c:
+        row = self.get_note(uuid)
+        if row is not None and str(row["ZTRASHED"]) == "0":
             modified = row["ZMODIFICATIONDATE"]
-            uuid = row["ZUNIQUEIDENTIFIER"]
             mod_dt = self.dt_conv(modified)
             conflict = mod_dt > ts_last_export
         return conflict
 
     def backup_bear_note(self, uuid):
         """Get single note from Bear sqlite db!"""
-        with sqlite3.connect(self.bear_db) as conn:
-            conn.row_factory = sqlite3.Row
-            query = (
-                "SELECT * FROM `ZSFNOTE` WHERE `ZUNIQUEIDENTIFIER` LIKE '" + uuid + "'"
-            )
-            cursor = conn.execute(query)
         title = ""
-        for row in cursor:  # Will only get one row if uuid is found!
+        row = self.get_note(uuid)
+        if row is not None:
             title = row["ZTITLE"]
             md_text = row["ZTEXT"].rstrip()
             modified = row["ZMODIFICATIONDATE"]
@@ -748,22 +1312,6 @@ class BearSync:
         lines.insert(1, link)
         return "\n".join(lines)
 
-    def init_gettag_script(self):
-        """Gettag script"""
-        gettag_script = """#!/bin/bash
-        if [[ ! -e $1 ]] ; then
-        echo 'file missing or not specified'
-        exit 0
-        fi
-        JSON="$(xattr -p com.apple.metadata:_kMDItemUserTags "$1" | xxd -r -p | plutil -convert json - -o -)"
-        echo $JSON > "$2"
-        """
-        temp = os.path.join(self.home, "temp")
-        if not os.path.exists(temp):
-            os.makedirs(temp)
-        self.write_file(self.gettag_sh, gettag_script, 0)
-        subprocess.call(["chmod", "777", self.gettag_sh])
-
     def notify(self, message):
         """Notify"""
         title = "ul_sync_md.py"
@@ -771,7 +1319,7 @@ class BearSync:
             # Uses "terminal-notifier", download at:
             # https://github.com/julienXX/terminal-notifier/releases/download/2.0.0/terminal-notifier-2.0.0.zip
             # Only works with MacOS 10.11+
-            subprocess.call(
+            self.call(
                 [
                     "/Applications/terminal-notifier.app/Contents/MacOS/terminal-notifier",
                     "-message",
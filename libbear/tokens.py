@@ -0,0 +1,94 @@
+"""Tag, task and image link extraction for Bear notes"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# All tokens start on a single character (`#`, `-` or `[`) and capture the rest in
+# lookaheads, so overlapping tokens (e.g. a tag inside a task) are all found in a
+# single pass. The `#` lookbehind is checked after the `#` so every alternative
+# starts with a literal, which lets the regex engine skip ahead to candidates.
+# The lookaheads are the same expressions Bear sync always used:
+#   open tag:   (?<!\S)\#([.\w\/\-]+)[ \n]?(?!([\/ \w]+\w[#]))
+#   closed tag: (?<![\S])\#([^ \d][.\w\/ ]+?)\#([ \n]|$)
+#   task:       - \[ \] (.*)
+#   image:      \[image:(.+?)\]
+TOKEN = re.compile(
+    r"\#(?<!\S\#)"
+    r"(?:(?=(?P<hash>[.\w\/\-]+)[ \n]?(?![\/ \w]+\w[#])))?"
+    r"(?:(?=(?P<closed>[^ \d][.\w\/ ]+?)\#(?P<closed_end>[ \n]|$)))?"
+    r"|-(?= \[ \] (?P<task>.*))"
+    r"|\[(?=image:(?P<image>.+?)\])"
+)
+TASK = re.compile(r"- \[ \] (.*)")
+IMAGE = re.compile(r"\[image:(.+?)\]")
+IMAGE_PARTS = re.compile(r"\[image:(.+?)/(.+?)\]")
+
+_HIDE_IN_COMMENT = re.compile(r"(\n)[ \t]*(\#[\w.].+)")
+_HIDE_WITH_PERIOD = re.compile(r"(\n)[ \t]*(\#[\w.]+)")
+_RESTORE = re.compile(r"(\n)(?:<!--[ \t]*(\#[\w.].+?) -->|\.[ \t]*(\#[\w.]+))")
+
+
+@dataclass
+class Tokens:
+    """Tags, open tasks and image links of a note, in document order"""
+
+    hash_tags: List[str] = field(default_factory=list)
+    closed_tags: List[str] = field(default_factory=list)
+    tasks: List[str] = field(default_factory=list)
+    images: List[str] = field(default_factory=list)
+    first_tag: Optional[str] = None
+
+
+def tokenize(text: str) -> Tokens:
+    """Extract all tags (`#tag` and `#closed tag#`), open tasks and `[image:...]`
+    references from a note in one pass"""
+    tokens = Tokens()
+    # Ends of the last closed tag, task and image, as `re.findall` doesn't overlap them
+    closed_end = task_end = image_end = 0
+    for match in TOKEN.finditer(text):
+        start = match.start()
+        kind = text[start]
+        if kind == "#":
+            hash_tag = match.group("hash")
+            closed_tag = match.group("closed")
+            if closed_tag is not None and start < closed_end:
+                closed_tag = None
+            if hash_tag is not None:
+                tokens.hash_tags.append(hash_tag)
+            if closed_tag is not None:
+                tokens.closed_tags.append(closed_tag)
+                closed_end = match.end("closed_end")
+            if tokens.first_tag is None:
+                # A closed tag wins over an open one starting at the same `#`
+                tokens.first_tag = closed_tag if closed_tag is not None else hash_tag
+        elif kind == "-":
+            if start >= task_end:
+                tokens.tasks.append(match.group("task"))
+                task_end = match.end("task")
+        elif start >= image_end:
+            tokens.images.append(match.group("image"))
+            image_end = match.end("image") + 1
+    return tokens
+
+
+def find_tasks(text: str) -> List[str]:
+    """Open tasks (`- [ ] task`) of a note"""
+    return TASK.findall(text)
+
+
+def has_images(text: str) -> bool:
+    """Does the note reference any Bear image"""
+    return IMAGE.search(text) is not None
+
+
+def hide_tags(text: str, comment_block: bool = True) -> str:
+    """Hide tag lines from being seen as H1, either in HTML comments
+    (`<!-- #tag -->`) or by placing `period+space` at the start of the line"""
+    if comment_block:
+        return _HIDE_IN_COMMENT.sub(r"\1<!-- \2 -->", text)
+    return _HIDE_WITH_PERIOD.sub(r"\1. \2", text)
+
+
+def restore_tags(text: str) -> str:
+    """Undo `hide_tags`, in either form"""
+    return _RESTORE.sub(r"\1\2\3", text)
@@ -9,6 +9,8 @@ import html
 from bs4 import BeautifulSoup  # type: ignore
 import frontmatter  # type: ignore
 
+from common.html_backend import Backend
+
 
 def read_file(path: str) -> str:
     """Read the HTML file's content"""
@@ -17,9 +19,9 @@ def read_file(path: str) -> str:
     return data
 
 
-def parse_html(html: str) -> BeautifulSoup:
+def parse_html(html: str, backend: Backend = Backend()) -> BeautifulSoup:
     """Parse the HTML with Beautiful Soup"""
-    return BeautifulSoup(html, features="html.parser")
+    return backend.parse(html)
 
 
 @dataclass
@@ -49,25 +51,25 @@ def convert_to_markdown(_tiddler: Tiddler) -> str:
     return front_matter
 
 
-def export_to_markdown(input, output):
-    source = read_file(input)
-    soup = parse_html(source)
+def get_tiddlers(soup: BeautifulSoup) -> List[Tiddler]:
+    """All tiddlers of a wiki, except system ones"""
+    return [
+        element_to_tiddler(element)
+        for element in soup.find_all("div")
+        if "title" in element.attrs and not str(element["title"]).startswith("$:/")
+    ]
 
-    elems = soup.find_all("div")
 
-    if len(elems) > 0:
-        for element in elems:
-            if "title" in element.attrs and not element.attrs["title"].startswith(
-                "$:/"
-            ):
-                tiddler = element_to_tiddler(element)
-                md = convert_to_markdown(tiddler)
-                # save to markdown file
-                OUTPUT_FILE = os.path.join(
-                    output, tiddler.title.replace("/", "-") + ".md"
-                )
-                print(OUTPUT_FILE)
-                print(md, file=open(OUTPUT_FILE, "w"))
+def export_to_markdown(input, output, backend=Backend()):
+    source = read_file(input)
+    soup = parse_html(source, backend)
+
+    for tiddler in get_tiddlers(soup):
+        md = convert_to_markdown(tiddler)
+        # save to markdown file
+        OUTPUT_FILE = os.path.join(output, tiddler.title.replace("/", "-") + ".md")
+        print(OUTPUT_FILE)
+        print(md, file=open(OUTPUT_FILE, "w"))
 
 
 def import_from_markdown(input):
@@ -75,9 +77,9 @@ def import_from_markdown(input):
     return fm
 
 
-def import_files(source_dir, wiki):
+def import_files(source_dir, wiki, backend=Backend()):
     source = read_file(wiki)
-    soup = parse_html(source)
+    soup = parse_html(source, backend)
 
     for path, subdirs, files in os.walk(source_dir):
         for name in files:
@@ -100,9 +102,10 @@ def import_files(source_dir, wiki):
                     tiddler_div.find("pre").replace_with(pre)
 
     with open("index2.html", "w") as file:
-        file.write(soup.prettify(formatter=None))
+        file.write(backend.serialize(soup, formatter=None))
 
 
-VAULT = "/Users/rui/Sync/documents/wiki/garden"
-# export_to_markdown("index.html", VAULT)
-import_files(VAULT, "index.html")
+if __name__ == "__main__":
+    VAULT = "/Users/rui/Sync/documents/wiki/garden"
+    # export_to_markdown("index.html", VAULT)
+    import_files(VAULT, "index.html")
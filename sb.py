@@ -3,14 +3,23 @@
 # pylint: disable=R0903,I1101
 import argparse
 import glob
+import hashlib
+import io
+import json
 import os
 import pathlib
+import posixpath
 import shutil
 import logging
 import unicodedata
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, TextIO, Tuple
 import coloredlogs  # type: ignore
-from jupex import Notebook, parse_notebook
+from common.fs import file_hash
+from jupex import MAX_TEXT, ImageOutput, Notebook, OutputStore, SourceCell
+from jupex import parse_notebook
 
 # Create a logger object.
 logger = logging.getLogger("sb")
@@ -106,9 +115,185 @@ TEMPLATE = """
 """
 
 
+# The page before and after the notebook's content, written around it
+BEFORE_CONTENT, AFTER_CONTENT = TEMPLATE.split("{content}")
+# The content is inside a JavaScript template literal, where these are special
+TEMPLATE_ESCAPES = str.maketrans({"\\": "\\\\", "`": "\\`", "$": "\\$"})
+
+
+def write_html(_notebook: Notebook, sink: TextIO) -> None:
+    """Write a notebook's HTML to a file-like object, a cell at a time"""
+    sink.write(BEFORE_CONTENT.format(title=_notebook.title))
+    sink.writelines(
+        fragment.translate(TEMPLATE_ESCAPES) for fragment in _notebook.jupyter_md()
+    )
+    sink.write(AFTER_CONTENT.format(title=_notebook.title))
+
+
 def generate_html(_notebook: Notebook) -> str:
     """Generate HTML from a notebook"""
-    return TEMPLATE.format(title=_notebook.title, content=_notebook.to_jupyter_md())
+    html = io.StringIO()
+    write_html(_notebook, html)
+    return html.getvalue()
+
+
+# Manifest of the notebooks built, kept in the build folder
+MANIFEST = ".sb-manifest.json"
+# Folder of the build with the images of all notebooks' outputs
+IMAGES_FOLDER = "_images"
+# Bump when the HTML generated for a notebook changes, to rebuild all of them
+BUILD_VERSION = "3"
+
+
+def output_name(_notebook: Notebook) -> str:
+    """File name of a notebook's HTML"""
+    return (
+        _notebook.title.lower().replace(" ", "-").replace("?", "").replace("`", "")
+        + ".html"
+    )
+
+
+def notebook_images(_notebook: Notebook) -> List[str]:
+    """File names of a notebook's output images"""
+    return sorted(
+        {
+            posixpath.basename(output.url)
+            for cell in _notebook.cells
+            if isinstance(cell, SourceCell)
+            for output in cell.outputs
+            if isinstance(output, ImageOutput)
+        }
+    )
+
+
+def build_notebook(
+    notebook_file: str, build_dir: str, store: Optional[OutputStore]
+) -> Tuple[str, List[str]]:
+    """Generate a notebook's HTML in the build folder, with its outputs if there
+    is a `store`, returning its file name and its images"""
+    notebook = parse_notebook(notebook_file, store)
+    name = output_name(notebook)
+    with open(os.path.join(build_dir, name), "w", encoding="utf-8") as text_file:
+        write_html(notebook, text_file)
+    return name, notebook_images(notebook)
+
+
+def build_digest(max_text: Optional[int]) -> str:
+    """Hash of what, besides the notebook, makes up its HTML"""
+    recipe = f"{BUILD_VERSION}:{max_text}:{TEMPLATE}"
+    return hashlib.sha256(recipe.encode("utf-8")).hexdigest()
+
+
+def load_manifest(build_dir: str, digest: str) -> Dict[str, Dict[str, Any]]:
+    """Notebooks of the last build, with their hash, HTML file and images, if it
+    was built the same way"""
+    try:
+        with open(os.path.join(build_dir, MANIFEST), "r", encoding="utf-8") as data:
+            manifest = json.load(data)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("build") != digest:
+        return {}
+    return manifest.get("notebooks", {})
+
+
+def save_manifest(
+    build_dir: str, digest: str, notebooks: Dict[str, Dict[str, Any]]
+) -> None:
+    """Write the manifest, atomically"""
+    path = os.path.join(build_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as data:
+        json.dump({"build": digest, "notebooks": notebooks}, data, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def remove_output(build_dir: str, name: str, notebooks: Dict[str, Dict[str, Any]]):
+    """Delete a notebook's HTML, unless another notebook has the same file"""
+    if all(entry["output"] != name for entry in notebooks.values()):
+        path = os.path.join(build_dir, name)
+        if os.path.exists(path):
+            logger.debug("Removing %s.", path)
+            os.remove(path)
+
+
+def prune_images(build_dir: str, notebooks: Dict[str, Dict[str, Any]]) -> None:
+    """Delete the images no notebook has any more"""
+    folder = os.path.join(build_dir, IMAGES_FOLDER)
+    if not os.path.isdir(folder):
+        return
+    used = {image for entry in notebooks.values() for image in entry["images"]}
+    unused = set(os.listdir(folder)) - used
+    for image in unused:
+        os.remove(os.path.join(folder, image))
+    if unused:
+        logger.debug("Removed %d unused images.", len(unused))
+
+
+def output_store(build_dir: str, max_text: Optional[int]) -> Optional[OutputStore]:
+    """Where to save the images of outputs, if they are kept"""
+    if max_text is None:
+        return None
+    folder = os.path.join(build_dir, IMAGES_FOLDER)
+    return OutputStore(folder, IMAGES_FOLDER + "/", max_text)
+
+
+def remove_stale(
+    build_dir: str,
+    previous: Dict[str, Dict[str, Any]],
+    notebooks: Dict[str, Dict[str, Any]],
+) -> None:
+    """Delete the HTML of the previous build's notebooks that were deleted or
+    renamed, and the images no notebook has any more"""
+    for entry in previous.values():
+        remove_output(build_dir, entry["output"], notebooks)
+    prune_images(build_dir, notebooks)
+
+
+def is_built(build_dir: str, entry: Dict[str, Any]) -> bool:
+    """Are a notebook's HTML and images still in the build folder"""
+    folder = os.path.join(build_dir, IMAGES_FOLDER)
+    return os.path.exists(os.path.join(build_dir, entry["output"])) and all(
+        os.path.exists(os.path.join(folder, image)) for image in entry["images"]
+    )
+
+
+def build(
+    paths: List[str], build_dir: str, jobs: int = 1, max_text: Optional[int] = MAX_TEXT
+) -> Tuple[int, int]:
+    """Build the notebooks that changed since the last build, in `jobs`
+    processes, and remove the HTML and images of deleted notebooks. Text outputs
+    longer than `max_text` characters are truncated, and all outputs are left out
+    if it is None. Returns the number of notebooks built and of unchanged ones."""
+    digest = build_digest(max_text)
+    previous = load_manifest(build_dir, digest)
+    hashes = {os.path.basename(path): file_hash(path) for path in paths}
+    notebooks = {
+        name: entry
+        for name, entry in previous.items()
+        if hashes.get(name) == entry["hash"] and is_built(build_dir, entry)
+    }
+    changed = [path for path in paths if os.path.basename(path) not in notebooks]
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+            results = pool.map(
+                build_notebook,
+                changed,
+                repeat(build_dir),
+                repeat(output_store(build_dir, max_text)),
+            )
+            for path, (output, images) in zip(changed, results):
+                logger.debug("Saving %s.", os.path.join(build_dir, output))
+                name = os.path.basename(path)
+                notebooks[name] = {
+                    "hash": hashes[name],
+                    "output": output,
+                    "images": images,
+                }
+    finally:
+        save_manifest(build_dir, digest, notebooks)
+    # Only once all are built, as another notebook may now have a renamed one's file
+    remove_stale(build_dir, previous, notebooks)
+    return len(changed), len(paths) - len(changed)
 
 
 if __name__ == "__main__":
@@ -121,6 +306,33 @@ if __name__ == "__main__":
         help="Location of Jupyter notebooks",
     )
 
+    parser.add_argument(
+        "--clean",
+        dest="clean",
+        action="store_true",
+        help="Delete the previous build and build all notebooks",
+    )
+    parser.add_argument(
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes building notebooks",
+    )
+    parser.add_argument(
+        "--max-text",
+        dest="max_text",
+        type=int,
+        default=MAX_TEXT,
+        help="Longest text output kept, in characters",
+    )
+    parser.add_argument(
+        "--no-outputs",
+        dest="outputs",
+        action="store_false",
+        help="Leave out the outputs of code cells",
+    )
+
     args: argparse.Namespace = parser.parse_args()
 
     if args.source:
@@ -132,26 +344,15 @@ if __name__ == "__main__":
             BUILD_DIR = os.path.join(SOURCE, "_build_sb")
             logger.debug("Source path -> %s", BUILD_DIR)
             dest = pathlib.Path(BUILD_DIR)
-            if dest.exists():
+            if dest.exists() and args.clean:
                 logger.debug("Output %s exists. Cleaning", BUILD_DIR)
                 shutil.rmtree(BUILD_DIR)
-            logger.debug("Creating %s.", BUILD_DIR)
-            os.mkdir(BUILD_DIR)
-            for notebook_file in files:
-                notebook = parse_notebook(notebook_file)
-                HTML_SOURCE = generate_html(notebook)
-                html_file = (
-                    os.path.join(
-                        BUILD_DIR,
-                        notebook.title.lower()
-                        .replace(" ", "-")
-                        .replace("?", "")
-                        .replace("`", ""),
-                    )
-                    + ".html"
-                )
-                with open(html_file, "w") as text_file:
-                    logger.debug("Saving %s.", html_file)
-                    text_file.write(HTML_SOURCE)
+            if not dest.exists():
+                logger.debug("Creating %s.", BUILD_DIR)
+                os.mkdir(BUILD_DIR)
+            rebuilt, unchanged = build(
+                files, BUILD_DIR, args.jobs, args.max_text if args.outputs else None
+            )
+            logger.info("Built %d notebooks, %d unchanged.", rebuilt, unchanged)
     else:
         parser.print_help()